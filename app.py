@@ -1,35 +1,30 @@
 import os
-import fitz
-import pdfplumber
-import pytesseract
-from PIL import Image
-from docx import Document
-import numpy as np
-import faiss
+import base64
 import logging
-import shutil
-import hashlib
 import gradio as gr
-import openai
 from dotenv import load_dotenv
 import re
 
-from sentence_transformers import SentenceTransformer
+# Heavy dependencies (OCR/PDF extractors, faiss, sentence-transformers, openai)
+# are imported on first use; the model and index load in a warm-up thread.
 from file_utils import (
     save_file,
     is_valid_file,
-    extract_text_from_file,
-    index_document,
-    load_or_create_faiss_index,
-    learn_from_text
+    start_warmup,
+    wait_until_ready,
+    readiness,
+    ingest_upload,
+    SERVING_MODE
 )
-from ask_tina import answer_query_with_knowledge
-from auth import authenticate_user, register_user, is_admin, send_password_reset, recover_user_email
-from database import log_query, get_conn, init_db, store_file_text, has_uploaded_knowledge
+from auth import authenticate_user, register_user, is_admin, send_password_reset, recover_user_email, current_user, username_index
+from database import log_query, get_conn, init_db, has_uploaded_knowledge
+from uploads import start_upload, append_chunk, upload_status, finish_upload, purge_stale_uploads
+from rate_limit import RateLimiter, client_ip
+from metrics import METRICS_PORT, stage, track_request, start_metrics_server
+from pipeline import answer_question
+import faq
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-print("OpenAI API Key Loaded:", openai.api_key)
 
 try:
     init_db()
@@ -37,15 +32,19 @@ except Exception as e:
     logging.error(f"❌ Failed to initialize database: {e}")
     raise SystemExit("Database initialization failed.")
 
-load_or_create_faiss_index()
+start_warmup()
+username_index.start_loading()
+# Reader workers reuse the FAQ entries the writer (or cron: python faq.py) builds.
+if SERVING_MODE != "reader":
+    faq.start_refresher()
+
+# How long a question may wait for warm-up before we answer "still starting".
+WARMUP_WAIT_SECONDS = float(os.getenv("WARMUP_WAIT_SECONDS", "20"))
 
 SESSION_TIMEOUT = 1800
 MAX_GUEST_QUESTIONS = 5
-
-EMBED_MODEL_PATH = os.getenv("EMBED_MODEL_PATH", "sentence-transformers/all-MiniLM-L6-v2")
-model = SentenceTransformer(EMBED_MODEL_PATH)
-
-FAISS_THRESHOLD = 0.45
+GUEST_WINDOW = int(os.getenv("GUEST_WINDOW_SECONDS", "86400"))
+guest_limiter = RateLimiter("guest_questions", MAX_GUEST_QUESTIONS, GUEST_WINDOW)
 
 
 def is_tax_related(question):
@@ -59,82 +58,137 @@ def is_tax_related(question):
     q = question.lower()
     return any(word in q for word in keywords)
 
-def count_guest_queries():
-    with get_conn() as conn:
-        c = conn.cursor()
-        c.execute("SELECT COUNT(*) FROM logs WHERE username = 'guest'")
-        return c.fetchone()[0]
-
-def score_threshold_fallback(question):
-    try:
-        query_vec = model.encode([question], convert_to_tensor=False)
-        scores, indices = index.search(np.array(query_vec, dtype=np.float32), 3)
-        if scores[0][0] > FAISS_THRESHOLD:
-            return [], "chatgpt"
-        return [knowledge_texts[i] for i in indices[0] if i < len(knowledge_texts)], "faiss"
-    except Exception as e:
-        logging.warning(f"Semantic search failed: {e}")
-        return [], "chatgpt"
-
-def handle_ask(question, user):
-    if not is_tax_related(question):
+def guest_key(request: gr.Request | None) -> str:
+    if not request:
+        return "anonymous"
+    peer = request.client.host if request.client else None
+    return client_ip(peer, request.headers.get("x-forwarded-for"))
+
+def readiness_message() -> str:
+    state = readiness()
+    if state["ready"]:
+        return f"🟢 Ready — {state['passages']} passages indexed (warm-up {state['warmup_seconds']}s)"
+    if state["error"]:
+        return f"🔴 Knowledge base failed to load: {state['error']}"
+    return "🟡 Loading knowledge base… questions will be answered shortly."
+
+def handle_ask(question, user, request: gr.Request = None):
+    with track_request() as timings, stage("ask_total"):
+        return _answer(question, user, request, timings)
+
+def _answer(question, user, request, timings):
+    with stage("keyword_gate"):
+        tax_related = is_tax_related(question)
+    if not tax_related:
         return gr.update(value="❌ TINA only answers questions related to Philippine taxation."), gr.update(visible=False), gr.update()
 
-    if user == "guest":
-        used = count_guest_queries()
-        if used >= MAX_GUEST_QUESTIONS:
-            return gr.update(value=""), gr.update(value="❌ Guest users can only ask 5 questions."), gr.update()
-    else:
-        used = 0
-
-    results, source = score_threshold_fallback(question)
-
-    if source == "chatgpt":
-        import openai
-        try:
-            completion = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": question}]
-            )
-            results = [completion.choices[0].message.content.strip()]
-        except Exception as e:
-            logging.error(f"OpenAI call failed: {e}")
-            return gr.update(value="❌ Failed to get answer from AI."), gr.update(visible=False), gr.update()
+    if not wait_until_ready(WARMUP_WAIT_SECONDS):
+        return gr.update(value="⏳ TINA is still starting up. Please try again in a moment."), gr.update(visible=False), gr.update()
 
-    unique_results = list(dict.fromkeys(results))
-    answer = "\n\n---\n\n".join(unique_results)
+    remaining = None
+    def admit():
+        nonlocal remaining
+        allowed, remaining = guest_limiter.hit(guest_key(request))
+        return allowed
 
-    if source == "chatgpt":
-        learn_from_text(answer)
-
-    log_query(user, question, source, answer)
-    remaining = MAX_GUEST_QUESTIONS - used - 1 if user == 'guest' else "∞"
+    try:
+        if user == "guest":
+            answer, source = answer_question(question, user, timings, admit=admit,
+                                             refund=lambda: guest_limiter.refund(guest_key(request)))
+        else:
+            answer, source = answer_question(question, user, timings)
+    except Exception as e:
+        logging.error(f"Answering failed: {e}")
+        return gr.update(value="❌ Failed to get answer from AI."), gr.update(visible=False), gr.update()
+    if answer is None:
+        return gr.update(value=""), gr.update(value=f"❌ Guest users can only ask {MAX_GUEST_QUESTIONS} questions."), gr.update()
     return gr.update(value=answer + f"\n\n📌 {'Guest questions left: ' + str(remaining) if user == 'guest' else 'Logged in user'}"), gr.update(visible=False), gr.update()
 
-def handle_upload(file, user):
+def handle_upload(file, user, session_token=None):
     try:
-        if user == "guest" or not user:
+        claims = current_user(session_token)
+        if user == "guest" or not user or not claims or claims.get("email") != user:
             return "❌ Only logged in users can upload."
         if not is_valid_file(file.name):
             return "❌ Invalid file type."
 
-        path, err = save_file(file)
+        path, digest, err = save_file(file)
         if not path:
             return err
+        return index_saved_upload(path, digest, os.path.basename(file.name), user)
+    except Exception as e:
+        logging.error(f"Upload failed: {e}")
+        return "❌ Error"
+
+def index_saved_upload(path, digest, source, user):
+    # Indexing before warm-up would build a fresh index over the one still loading.
+    if not wait_until_ready(WARMUP_WAIT_SECONDS):
+        return "⏳ TINA is still starting up. Please try again in a moment."
+    doc_hash, is_new = ingest_upload(path, digest, source)
+    if not doc_hash:
+        return f"❌ Could not extract text from {source}. Is it a blank or unreadable scan?"
+    if not is_new:
+        return f"ℹ️ Already known, nothing new to index: {path}"
+    if SERVING_MODE == "reader":
+        return f"✅ Uploaded: {path} by user: {user}. It will be searchable once the index writer publishes it."
+    return f"✅ Uploaded and indexed: {path} by user: {user}"
+
+# Resumable upload API for large scans (gradio_client: /upload_start, /upload_chunk,
+# /upload_status, /upload_finish). Chunks are base64 text; errors come back as "❌ ...".
+def handle_upload_start(filename, size, session_token):
+    if not current_user(session_token):
+        return "❌ Only logged in users can upload."
+    if not is_valid_file(filename):
+        return "❌ Invalid file type."
+    purge_stale_uploads()
+    try:
+        return start_upload(filename, int(size) if size else None)
+    except ValueError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        logging.error(f"Upload start failed: {e}")
+        return "❌ Error"
 
-        text = extract_text_from_file(path)
-        index_document(text)
-        learn_from_text(text)
-        store_file_text(file.name, text)
+def handle_upload_chunk(upload_id, offset, data, session_token):
+    if not current_user(session_token):
+        return "❌ Only logged in users can upload."
+    try:
+        return str(append_chunk(upload_id, int(offset), base64.b64decode(data)))
+    except ValueError as e:  # includes malformed base64
+        return f"❌ {e}"
+    except Exception as e:
+        logging.error(f"Upload chunk failed: {e}")
+        return "❌ Error"
 
-        return f"✅ Uploaded and indexed: {path} by user: {user}"
+def handle_upload_status(upload_id, session_token):
+    if not current_user(session_token):
+        return "❌ Only logged in users can upload."
+    try:
+        return str(upload_status(upload_id))
+    except ValueError as e:
+        return f"❌ {e}"
     except Exception as e:
-        logging.error(f"Upload failed: {e}")
+        logging.error(f"Upload status failed: {e}")
+        return "❌ Error"
+
+def handle_upload_finish(upload_id, session_token):
+    user = current_user(session_token)
+    if not user:
+        return "❌ Only logged in users can upload."
+    try:
+        path, digest, filename = finish_upload(upload_id)
+        return index_saved_upload(path, digest, filename, user.get("email"))
+    except ValueError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        logging.error(f"Chunked upload failed: {e}")
         return "❌ Error"
 
 with gr.Blocks() as interface:
     gr.Markdown("# 🇵🇭 TINA: Tax Information Navigation Assistant")
+    status = gr.Markdown(readiness_message())
     login_state = gr.State("guest")
+    session_state = gr.State("")
 
     with gr.Tabs() as tabs:
         with gr.Tab("Login", id=0):
@@ -145,19 +199,19 @@ with gr.Blocks() as interface:
             def handle_login(u, p):
                 profile = authenticate_user(u, p)
                 if not profile:
-                    return "❌ Login failed.", "guest"
+                    return "❌ Login failed.", "guest", ""
                 if "error" in profile:
-                    return profile["error"], "guest"
-                return f"✅ Logged in as {profile['role']}", profile["email"]
+                    return profile["error"], "guest", ""
+                return f"✅ Logged in as {profile['role']}", profile["email"], profile["session"]
 
-            gr.Button("Login").click(handle_login, [login_user, login_pass], [login_result, login_state])
-            gr.Button("Logout").click(fn=lambda: ("Logged out.", "guest"), inputs=None, outputs=[login_result, login_state])
+            gr.Button("Login").click(handle_login, [login_user, login_pass], [login_result, login_state, session_state])
+            gr.Button("Logout").click(fn=lambda: ("Logged out.", "guest", ""), inputs=None, outputs=[login_result, login_state, session_state])
 
         with gr.Tab("Ask TINA", id=1):
             q = gr.Textbox(label="Ask a Tax Question")
             a = gr.Textbox(label="Answer")
             error_box = gr.Textbox(visible=False)
-            q.submit(fn=lambda question, uid: handle_ask(question, uid), inputs=[q, login_state], outputs=[a, error_box, tabs])
+            q.submit(fn=handle_ask, inputs=[q, login_state], outputs=[a, error_box, tabs])
 
         with gr.Tab("Signup", id=2):
             signup_user = gr.Textbox(label="Username")
@@ -181,7 +235,7 @@ with gr.Blocks() as interface:
             gr.Button("Send Reset Email").click(send_password_reset, inputs=reset_email, outputs=reset_result)
 
         with gr.Tab("Recover Email", id=4):
-            gr.Markdown("🔎 Enter your username or part of it to recover email.")
+            gr.Markdown("🔎 Enter at least 3 characters of your username to recover email.")
             recover_keyword = gr.Textbox(label="Keyword")
             recover_result = gr.Textbox(label="Possible Matches")
             gr.Button("Search Email").click(
@@ -189,11 +243,41 @@ with gr.Blocks() as interface:
                 inputs=recover_keyword,
                 outputs=recover_result
             )
+            # Search as the user types; only the latest pending keystroke is run.
+            recover_keyword.change(
+                fn=lambda k: "\n".join(recover_user_email(k)),
+                inputs=recover_keyword,
+                outputs=recover_result,
+                trigger_mode="always_last",
+                show_progress="hidden"
+            )
 
         with gr.Tab("Help TINA Learn", id=5):
             file_upload = gr.File(label="Upload File", file_types=['.pdf', '.txt', '.jpg', '.png', '.docx', '.doc', '.odt', '.rtf'])
             upload_result = gr.Textbox(label="Upload Status")
-            gr.Button("Upload").click(fn=handle_upload, inputs=[file_upload, login_state], outputs=upload_result)
+            gr.Button("Upload").click(fn=handle_upload, inputs=[file_upload, login_state, session_state], outputs=upload_result)
+
+            with gr.Row(visible=False):
+                # gr.State is not exposed over the API, so callers pass their session token explicitly.
+                chunk_token = gr.Textbox()
+                chunk_upload_id = gr.Textbox()
+                chunk_filename = gr.Textbox()
+                chunk_size = gr.Number()
+                chunk_offset = gr.Number()
+                chunk_data = gr.Textbox()
+                chunk_result = gr.Textbox()
+                gr.Button().click(handle_upload_start, [chunk_filename, chunk_size, chunk_token], chunk_result, api_name="upload_start")
+                gr.Button().click(handle_upload_chunk, [chunk_upload_id, chunk_offset, chunk_data, chunk_token], chunk_result, api_name="upload_chunk")
+                gr.Button().click(handle_upload_status, [chunk_upload_id, chunk_token], chunk_result, api_name="upload_status")
+                gr.Button().click(handle_upload_finish, [chunk_upload_id, chunk_token], chunk_result, api_name="upload_finish")
+
+    # Poll readiness until warm-up finishes, then stop the timer.
+    readiness_timer = gr.Timer(3)
+    readiness_timer.tick(
+        fn=lambda: (readiness_message(), gr.Timer(active=not readiness()["ready"])),
+        inputs=None,
+        outputs=[status, readiness_timer]
+    )
 
     gr.HTML("""
     <hr>
@@ -207,4 +291,6 @@ def launch():
     return interface
 
 if __name__ == "__main__":
+    if METRICS_PORT:
+        start_metrics_server(int(METRICS_PORT))
     launch().launch()
@@ -1,32 +1,152 @@
 # ask_tina.py
 
 import os
+import re
 import time
+import random
 import logging
-import openai
-from functools import lru_cache
+import threading
 from file_utils import semantic_search
+from metrics import OPENAI_ERRORS, OPENAI_TOKENS, Counter, stage
+from session import TTLCache
 from dotenv import load_dotenv
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-@lru_cache(maxsize=32)
-def fallback_to_chatgpt(prompt: str) -> str:
-    logging.warning("Fallback to ChatGPT activated.")
-    last_error = ""
-    for attempt in range(3):
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "4"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "30"))
+OPENAI_BACKOFF_BASE = 0.5
+OPENAI_BACKOFF_CAP = 8.0
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "300"))
+# Who answers retrieval misses: "chatgpt" (OpenAI API) or "lora" (local fine-tuned adapter).
+ANSWER_BACKEND = os.getenv("ANSWER_BACKEND", "chatgpt").lower()
+
+COALESCED = Counter("tina_openai_coalesced_total", "Questions answered by joining an identical in-flight OpenAI request.")
+
+# Words that do not change what is being asked; dropped when matching in-flight questions.
+_FILLER = {"a", "an", "the", "please", "pls", "po", "ba", "kindly", "can", "you", "tell", "me"}
+
+class SingleFlight:
+    """Run at most one call per key at a time; concurrent callers share its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {"done": threading.Event(), "result": None, "error": None}
+        if not leader:
+            COALESCED.inc()
+            call["done"].wait()
+        else:
+            try:
+                call["result"] = fn()
+            except BaseException as e:
+                call["error"] = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call["done"].set()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+_in_flight = SingleFlight()
+_openai_slots = threading.BoundedSemaphore(OPENAI_MAX_CONCURRENCY)
+_answer_cache = TTLCache(ttl=ANSWER_CACHE_TTL, max_entries=1024)
+
+def normalize_question(question: str) -> str:
+    words = re.findall(r"\w+", question.lower())
+    return " ".join(w for w in words if w not in _FILLER)
+
+def _is_retryable(openai, error: Exception) -> bool:
+    errors = getattr(openai, "error", None)
+    retryable = tuple(
+        getattr(errors, name) for name in
+        ("RateLimitError", "APIConnectionError", "Timeout", "ServiceUnavailableError", "APIError", "TryAgain")
+        if errors is not None and hasattr(errors, name)
+    )
+    return isinstance(error, retryable) if retryable else True
+
+def _backoff_seconds(attempt: int) -> float:
+    # Full jitter keeps a burst of retries from hitting the API in lockstep.
+    return random.uniform(0, min(OPENAI_BACKOFF_CAP, OPENAI_BACKOFF_BASE * 2 ** attempt))
+
+def _call_openai(prompt: str) -> str:
+    import openai  # deferred: only needed once retrieval misses
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+    for attempt in range(OPENAI_MAX_RETRIES):
+        # Hold a slot only while a request is in flight, not while backing off.
+        if not _openai_slots.acquire(timeout=OPENAI_QUEUE_TIMEOUT):
+            raise RuntimeError("Too many concurrent ChatGPT requests.")
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.choices[0].message["content"].strip()
+            with stage("openai"):
+                response = openai.ChatCompletion.create(
+                    model=OPENAI_MODEL,
+                    messages=[{"role": "user", "content": prompt}]
+                )
+            usage = getattr(response, "usage", None) or {}
+            OPENAI_TOKENS.inc("prompt", amount=usage.get("prompt_tokens", 0))
+            OPENAI_TOKENS.inc("completion", amount=usage.get("completion_tokens", 0))
+            return response.choices[0].message.content.strip()
         except Exception as e:
-            last_error = str(e)
-            logging.error(f"[ChatGPT Retry {attempt+1}] {last_error}")
-            time.sleep(1.5)
-    return f"[ChatGPT Error] All retries failed. Reason: {last_error}"
+            OPENAI_ERRORS.inc()
+            if attempt + 1 >= OPENAI_MAX_RETRIES or not _is_retryable(openai, e):
+                raise
+            delay = _backoff_seconds(attempt)
+            logging.error(f"[ChatGPT Retry {attempt+1}] {e}; retrying in {delay:.1f}s")
+        finally:
+            _openai_slots.release()
+        time.sleep(delay)
+
+def ask_chatgpt(prompt: str) -> str:
+    """Answer ``prompt`` with ChatGPT; raises if every attempt fails.
+
+    Identical or near-identical questions (same words, ignoring case,
+    punctuation and filler) already in flight share one upstream request, and
+    answers are reused for ANSWER_CACHE_TTL seconds.
+    """
+    key = normalize_question(prompt) or prompt
+    cached = _answer_cache.get(key)
+    if cached is not None:
+        return cached
+
+    def fetch():
+        answer = _call_openai(prompt)
+        _answer_cache.set(key, answer)
+        return answer
+
+    return _in_flight.do(key, fetch)
+
+def generate_answer(question: str) -> tuple[str, str]:
+    """Answer a retrieval miss with ANSWER_BACKEND; returns (answer, source).
+
+    The local LoRA backend falls back to ChatGPT when no adapter is available
+    or generation fails.
+    """
+    if ANSWER_BACKEND == "lora":
+        try:
+            import lora_backend
+            if lora_backend.is_available():
+                key = "lora:" + (normalize_question(question) or question)
+                return _in_flight.do(key, lambda: lora_backend.generate(question)), "lora"
+            logging.warning("ANSWER_BACKEND=lora but no adapter under tina-lora/run-*; using ChatGPT.")
+        except Exception as e:
+            logging.error(f"Local LoRA answer failed, using ChatGPT: {e}")
+    return ask_chatgpt(question), "chatgpt"
+
+def fallback_to_chatgpt(prompt: str) -> str:
+    logging.warning("Fallback to ChatGPT activated.")
+    try:
+        return ask_chatgpt(prompt)
+    except Exception as e:
+        return f"[ChatGPT Error] All retries failed. Reason: {e}"
 
 def answer_query_with_knowledge(query: str) -> tuple[list[str], str]:
     try:
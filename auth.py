@@ -2,8 +2,10 @@ import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from collections import defaultdict
 import logging
+from rate_limit import RateLimiter
+from session import TTLCache, check_session_secret, issue_session_token, verify_session_token
+from username_index import CHANGED_COLUMN, UsernameIndex
 
 load_dotenv()
 
@@ -17,10 +19,24 @@ if not SUPABASE_ANON_KEY:
     raise RuntimeError("❌ SUPABASE_KEY (anon) is missing. Set it in environment variables or .env")
 if not SUPABASE_SERVICE_ROLE_KEY:
     raise RuntimeError("❌ SUPABASE_SERVICE_ROLE_KEY is missing. Set it in environment variables or .env")
+check_session_secret()
 
+# Module-level clients keep their HTTP connection pools alive across calls.
 anon_supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
 service_supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+profile_cache = TTLCache()
+
+RECOVER_RESULT_LIMIT = 10
+
+def _fetch_username_page(start: int, end: int, since: str | None = None) -> list[dict]:
+    query = service_supabase.table("profiles").select(f"username, email, {CHANGED_COLUMN}")
+    if since:
+        query = query.gte(CHANGED_COLUMN, since)
+    return query.order(CHANGED_COLUMN).order("id").range(start, end).execute().data
+
+username_index = UsernameIndex(_fetch_username_page)
+
 PLAN_DURATIONS = {
     "free": 7,
     "monthly": 30,
@@ -28,9 +44,9 @@ PLAN_DURATIONS = {
     "annual": 365
 }
 
-RESET_RATE_LIMIT = defaultdict(lambda: (0, datetime.min))
 MAX_RESET_ATTEMPTS = 3
 RESET_WINDOW = timedelta(minutes=15)
+password_reset_limiter = RateLimiter("password_reset", MAX_RESET_ATTEMPTS, RESET_WINDOW.total_seconds())
 
 def register_user(username: str, email: str, password: str) -> str:
     try:
@@ -65,6 +81,7 @@ def register_user(username: str, email: str, password: str) -> str:
         except Exception as e:
             logging.error(f"Profile insert error: {e}")
             return f"❌ Signup failed. {e}"
+        username_index.add(username, email)
 
         return "✅ Signup successful. Please Confirm Your Email then login."
     except Exception as e:
@@ -83,12 +100,39 @@ def authenticate_user(email: str, password: str) -> dict | None:
         if not user.email_confirmed_at:
             return {"error": "❌ Email not confirmed. Please confirm your email to log in."}
 
-        profile = service_supabase.table("profiles").select("*").eq("id", user.id).single().execute().data
-        return {"id": user.id, "email": email, **profile} if profile else None
+        profile = _fetch_profile(user.id)
+        if not profile:
+            return None
+        profile_cache.set(user.id, profile)
+        profile = {"id": user.id, "email": email, **profile}
+        return {**profile, "session": issue_session_token(profile)}
     except Exception as e:
         logging.warning(f"Login failed for {email}: {e}")
         return None
 
+def _fetch_profile(user_id: str) -> dict | None:
+    return service_supabase.table("profiles").select("*").eq("id", user_id).single().execute().data
+
+def get_profile(user_id: str) -> dict | None:
+    """Profile row for ``user_id``, served from the TTL cache when fresh."""
+    try:
+        return profile_cache.get_or_fetch(user_id, _fetch_profile)
+    except Exception as e:
+        logging.warning(f"Profile fetch failed for {user_id}: {e}")
+        return None
+
+def current_user(session_token: str) -> dict | None:
+    """Claims of a valid session token, with role and plan from the cached profile."""
+    claims = verify_session_token(session_token)
+    if not claims:
+        return None
+    # The token may predate a plan change; the cached profile is at most PROFILE_CACHE_TTL old.
+    profile = get_profile(claims["sub"]) or {}
+    for key in ("role", "subscription_level", "subscription_expires"):
+        if key in profile:
+            claims[key] = profile[key]
+    return claims
+
 def renew_subscription(user_id: str, plan: str) -> str:
     duration = PLAN_DURATIONS.get(plan)
     if not duration:
@@ -99,41 +143,31 @@ def renew_subscription(user_id: str, plan: str) -> str:
             "subscription_level": plan,
             "subscription_expires": expiry
         }).eq("id", user_id).execute()
+        profile_cache.invalidate(user_id)
         return f"✅ Subscription updated to {plan} until {expiry}"
     except Exception as e:
         logging.error(f"Subscription update error for user {user_id}: {e}")
         return "❌ Failed to update subscription."
 
 def is_admin(user_id: str) -> bool:
-    try:
-        res = service_supabase.table("profiles").select("role").eq("id", user_id).single().execute()
-        return res.data.get("role") == "admin"
-    except Exception as e:
-        logging.warning(f"Admin check failed for {user_id}: {e}")
-        return False
+    profile = get_profile(user_id)
+    return bool(profile) and profile.get("role") == "admin"
 
 def send_password_reset(email: str) -> str:
-    now = datetime.utcnow()
-    attempts, last_reset = RESET_RATE_LIMIT[email]
-
-    if now - last_reset > RESET_WINDOW:
-        attempts = 0
-
-    if attempts >= MAX_RESET_ATTEMPTS:
+    allowed, _ = password_reset_limiter.hit(email.strip().lower())
+    if not allowed:
         return "❌ Too many reset attempts. Try again later."
 
     try:
         anon_supabase.auth.reset_password_email(email)
-        RESET_RATE_LIMIT[email] = (attempts + 1, now)
         return "📧 Password reset email sent."
     except Exception as e:
         logging.warning(f"Password reset failed for {email}: {e}")
         return "❌ Failed to send reset email."
 
-def recover_user_email(keyword: str) -> list[str]:
+def recover_user_email(keyword: str, limit: int = RECOVER_RESULT_LIMIT) -> list[str]:
     try:
-        res = service_supabase.table("profiles").select("username, email").ilike("username", f"%{keyword}%").execute()
-        return [f"{row['username']} <{row['email']}>" for row in res.data] if res.data else []
+        return [f"{username} <{email}>" for username, email in username_index.search(keyword, limit=limit)]
     except Exception as e:
         logging.warning(f"Recover email failed for keyword '{keyword}': {e}")
         return []
@@ -0,0 +1,46 @@
+# benchmarks/bench_rate_limit.py
+"""Per-check overhead of the rate limiter backends.
+
+    python benchmarks/bench_rate_limit.py --checks 5000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rate_limit import RateLimiter, MemoryBackend, SQLiteBackend
+
+def bench(backend, checks: int, keys: int) -> dict:
+    limiter = RateLimiter("bench", limit=10, window=60, backend=backend)
+    timings = []
+    for i in range(checks):
+        start = time.perf_counter()
+        limiter.hit(f"client-{i % keys}")
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "backend": type(backend).__name__,
+        "checks": checks,
+        "keys": keys,
+        "us_mean": round(sum(timings) / len(timings), 2),
+        "us_p50": round(timings[len(timings) // 2], 2),
+        "us_p99": round(timings[int(len(timings) * 0.99)], 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checks", type=int, default=5000)
+    parser.add_argument("--keys", type=int, default=500)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [
+            bench(MemoryBackend(), args.checks, args.keys),
+            bench(SQLiteBackend(os.path.join(tmp, "limits.db")), args.checks, args.keys),
+        ]
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# benchmarks/corpus.py
+"""Deterministic synthetic Philippine-tax corpus and question set for benchmarks."""
+import random
+
+FORMS = ["1700", "1701", "1701Q", "1702", "1702Q", "2550M", "2550Q", "2551Q", "1601C", "1604C", "2316", "0619E"]
+ISSUANCES = ["RR", "RMC", "RMO"]
+SECTIONS = ["22", "24", "27", "32", "34", "57", "58", "106", "108", "109", "116", "248", "249"]
+SUBSECTIONS = ["A", "B", "C", "D", "L"]
+TOPICS = [
+    ("income tax", "individuals earning purely compensation income"),
+    ("value-added tax", "sellers of goods and services exceeding the VAT threshold"),
+    ("percentage tax", "non-VAT registered persons"),
+    ("withholding tax", "employers withholding on compensation"),
+    ("donor's tax", "gifts in excess of the annual exemption"),
+    ("estate tax", "the net estate of a decedent"),
+    ("documentary stamp tax", "loan agreements and deeds of sale"),
+    ("capital gains tax", "sales of real property classified as capital assets"),
+]
+DEADLINES = ["April 15", "the 20th day of the following month", "the 25th day after the quarter", "January 31", "within 30 days"]
+RATES = ["1%", "3%", "6%", "8%", "12%", "15%", "20%", "25%", "30%"]
+
+def make_passage(rng: random.Random, doc_id: int) -> dict:
+    topic, who = rng.choice(TOPICS)
+    form = rng.choice(FORMS)
+    section = f"Sec. {rng.choice(SECTIONS)}({rng.choice(SUBSECTIONS)})"
+    issuance = f"{rng.choice(ISSUANCES)} {rng.randint(1, 30)}-{rng.randint(2015, 2024)}"
+    rate = rng.choice(RATES)
+    deadline = rng.choice(DEADLINES)
+    text = (
+        f"Under {section} of the NIRC as amended, {topic} at {rate} applies to {who}. "
+        f"The return is filed using BIR Form {form} on or before {deadline}. "
+        f"{issuance} prescribes the implementing rules, including penalties under Sec. 248 "
+        f"for late filing and interest under Sec. 249. Reference no. {doc_id}."
+    )
+    return {"id": doc_id, "text": text, "form": form, "section": section, "issuance": issuance, "topic": topic}
+
+def generate_corpus(size: int, seed: int = 7) -> list[dict]:
+    rng = random.Random(seed)
+    return [make_passage(rng, i) for i in range(size)]
+
+def generate_questions(corpus: list[dict], count: int, seed: int = 11) -> list[dict]:
+    """Questions paired with the id of the passage that answers them."""
+    rng = random.Random(seed)
+    templates = [
+        "What is the deadline for filing BIR Form {form}?",
+        "What does {section} say about {topic}?",
+        "Which rules does {issuance} implement?",
+        "Who is covered by {topic} under {section}?",
+    ]
+    questions = []
+    for _ in range(count):
+        doc = rng.choice(corpus)
+        questions.append({"question": rng.choice(templates).format(**doc), "answer_id": doc["id"]})
+    return questions
@@ -0,0 +1,386 @@
+# benchmarks/run.py
+"""Reproducible performance benchmarks for TINA.
+
+Runs in a throwaway working directory (its own SQLite database, index files
+and knowledge_files/) against a deterministic synthetic corpus, and writes
+machine-readable results so runs can be compared:
+
+    python benchmarks/run.py --output bench_results.json
+    python benchmarks/run.py --suites search --sizes 1000,100000,1000000
+    python benchmarks/run.py --compare bench_results.json --output new.json
+
+Suites whose dependencies are missing are reported as skipped.
+"""
+import os
+import sys
+import json
+import time
+import types
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from corpus import generate_corpus, generate_questions
+
+EMBED_DIM = 384
+
+def percentiles(samples_ms: list[float]) -> dict:
+    ordered = sorted(samples_ms)
+    pick = lambda q: round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 3)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+    }
+
+def timed(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
+
+def make_sample_files(folder: str, text: str) -> dict:
+    """One sample file per supported format; formats whose writer is missing are left out."""
+    files = {}
+    path = os.path.join(folder, "sample.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    files[".txt"] = path
+    try:
+        import fitz
+        path = os.path.join(folder, "sample.pdf")
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), text[:200])
+        doc.save(path)
+        doc.close()
+        files[".pdf"] = path
+    except ImportError:
+        pass
+    try:
+        import docx
+        path = os.path.join(folder, "sample.docx")
+        document = docx.Document()
+        for sentence in text.split(". "):
+            document.add_paragraph(sentence)
+        document.save(path)
+        files[".docx"] = path
+    except ImportError:
+        pass
+    try:
+        from PIL import Image, ImageDraw
+        path = os.path.join(folder, "sample.png")
+        img = Image.new("RGB", (800, 200), color="white")
+        ImageDraw.Draw(img).text((10, 80), text[:80], fill="black")
+        img.save(path)
+        files[".png"] = path
+    except ImportError:
+        pass
+    return files
+
+def bench_extract(args, corpus, questions) -> dict:
+    from file_utils import extract_text_from_file
+    text = " ".join(doc["text"] for doc in corpus[:20])
+    files = make_sample_files(os.getcwd(), text)
+    results = {}
+    for ext, path in files.items():
+        extract_text_from_file(path)
+        reps = 3 if ext == ".png" else args.reps
+        results[ext] = percentiles([timed(extract_text_from_file, path) for _ in range(reps)])
+    return results
+
+def bench_embed(args, corpus, questions) -> dict:
+    import file_utils
+    model = file_utils.get_model()
+    texts = [doc["text"] for doc in corpus[:args.embed_docs]]
+    model.encode(texts[:8], convert_to_tensor=False)
+    results = {}
+    for batch_size in (1, 32):
+        start = time.perf_counter()
+        model.encode(texts, batch_size=batch_size, convert_to_tensor=False)
+        elapsed = time.perf_counter() - start
+        results[f"batch_{batch_size}"] = {"passages": len(texts), "passages_per_s": round(len(texts) / elapsed, 2)}
+    return results
+
+def bench_search(args, corpus, questions) -> dict:
+    import faiss
+    import numpy as np
+    import file_utils
+    rng = np.random.default_rng(3)
+    queries = rng.standard_normal((args.queries, EMBED_DIM)).astype(np.float32)
+    results = {}
+    for size in args.sizes:
+        index = faiss.IndexFlatL2(EMBED_DIM)
+        for start in range(0, size, 100000):
+            index.add(rng.standard_normal((min(100000, size - start), EMBED_DIM)).astype(np.float32))
+        faiss_ms = [timed(index.search, queries[i:i + 1], 3) for i in range(len(queries))]
+        entry = {"faiss_search": percentiles(faiss_ms), "index_mb": round(size * EMBED_DIM * 4 / 2**20, 1)}
+
+        # semantic_search end to end (query embedding + FAISS), with the embedding cache cold.
+        file_utils.index, file_utils.knowledge_texts = index, [""] * size
+        semantic_ms = []
+        for q in questions[:args.queries]:
+            file_utils._query_embeddings.clear()
+            semantic_ms.append(timed(file_utils.semantic_search, q["question"], 3))
+        entry["semantic_search"] = percentiles(semantic_ms)
+        results[str(size)] = entry
+        del index
+    file_utils.index, file_utils.knowledge_texts = None, []
+    return results
+
+def clustered_embeddings(rng, n: int, clusters: int = 200):
+    """Unit vectors scattered around topic centres, closer to real sentence embeddings than pure noise."""
+    import numpy as np
+    centres = rng.standard_normal((clusters, EMBED_DIM)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, EMBED_DIM)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def bench_quantization(args, corpus, questions) -> dict:
+    """Memory, recall@10 against exact search, and latency for each INDEX_TYPE."""
+    import faiss
+    import numpy as np
+    import vector_store
+    rng = np.random.default_rng(5)
+    results = {}
+    for size in args.sizes:
+        base = clustered_embeddings(rng, size)
+        queries = base[rng.integers(0, size, args.queries)] + 0.05 * rng.standard_normal((args.queries, EMBED_DIM)).astype(np.float32)
+        exact = faiss.IndexFlatL2(EMBED_DIM)
+        exact.add(base)
+        _, truth = exact.search(queries, 10)
+        del exact
+        entry = {}
+        for index_type in ("flat", "fp16", "sq8", "pq"):
+            index = vector_store.build_index(base, os.path.join(os.getcwd(), f"vectors-{index_type}.f32"), index_type)
+            variants = {index_type: index}
+            if isinstance(index, vector_store.RescoringIndex):
+                variants[f"{index_type}_no_rescore"] = index.index
+            for name, candidate in variants.items():
+                _, found = candidate.search(queries, 10)
+                recall = np.mean([len(set(f) & set(t)) / 10 for f, t in zip(found, truth)])
+                latency = [timed(candidate.search, queries[i:i + 1], 10) for i in range(len(queries))]
+                entry[name] = {
+                    "index_mb": round(vector_store.index_bytes(candidate) / 2**20, 2),
+                    "recall_at_10": round(float(recall), 4),
+                    "search": percentiles(latency),
+                }
+            del index, variants
+        results[str(size)] = entry
+    return results
+
+def bench_log_query(args, corpus, questions) -> dict:
+    from database import init_db, log_query, search_logs
+    init_db()
+    rows = [(q["question"], corpus[q["answer_id"]]["text"]) for q in questions]
+    start = time.perf_counter()
+    for i in range(args.log_rows):
+        question, answer = rows[i % len(rows)]
+        log_query("bench", question, "faiss", answer)
+    elapsed = time.perf_counter() - start
+    search_ms = [timed(search_logs, q["question"]) for q in questions[:args.queries]]
+    return {
+        "log_query": {"rows": args.log_rows, "rows_per_s": round(args.log_rows / elapsed, 1)},
+        "search_logs": percentiles(search_ms),
+    }
+
+def install_openai_stub(latency_s: float):
+    """Stand-in for the OpenAI SDK: fixed latency, canned answer, token usage."""
+    def create(model, messages, **kwargs):
+        time.sleep(latency_s)
+        content = f"Stubbed answer about {messages[-1]['content'][:60]}"
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+            usage={"prompt_tokens": 30, "completion_tokens": 40, "total_tokens": 70}
+        )
+    stub = types.ModuleType("openai")
+    stub.api_key = None
+    stub.ChatCompletion = types.SimpleNamespace(create=create)
+    sys.modules["openai"] = stub
+
+def ask_pipeline(question: str, user: str) -> str:
+    """One question through pipeline.answer_question, the path behind handle_ask,
+    timed as app.handle_ask times it. The keyword gate, Supabase auth and guest
+    limits stay in app.py, so the suite runs on a dev box."""
+    from metrics import stage, track_request
+    from pipeline import answer_question
+
+    with track_request() as timings, stage("ask_total"):
+        answer, _ = answer_question(question, user, timings)
+    return answer
+
+def bench_ask(args, corpus, questions) -> dict:
+    install_openai_stub(args.openai_latency_ms / 1000)
+    import file_utils
+    from database import init_db
+    from metrics import STAGE_SECONDS
+
+    init_db()
+    file_utils.get_model()  # a missing sentence-transformers reports the suite as skipped
+    file_utils.warm_up()
+    if not file_utils.is_ready():
+        raise RuntimeError(f"warm-up failed: {file_utils.readiness()['error']}")
+    file_utils.rebuild_from_texts([doc["text"] for doc in corpus[:args.ask_corpus]])
+
+    asked = [q["question"] for q in questions[:args.queries]]
+    # Off-corpus questions take the (stubbed) ChatGPT route and get learned.
+    asked += [f"What is the tax treatment of benchmark scenario {i} for income tax?" for i in range(args.queries // 4)]
+    before = STAGE_SECONDS.snapshot()
+    start = time.perf_counter()
+    latencies = [timed(ask_pipeline, question, "bench@example.com") for question in asked]
+    elapsed = time.perf_counter() - start
+    after = STAGE_SECONDS.snapshot()
+
+    stages = {}
+    for labels, (total, n) in after.items():
+        prev_total, prev_n = before.get(labels, (0.0, 0))
+        if n > prev_n:
+            stages[labels[0]] = {"calls": n - prev_n, "mean_ms": round((total - prev_total) * 1000 / (n - prev_n), 3)}
+    return {
+        "handle_ask": percentiles(latencies),
+        "questions_per_s": round(len(asked) / elapsed, 2),
+        "stages": stages,
+    }
+
+def throughput(fn, items: list, concurrency: int) -> dict:
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        list(pool.map(fn, items))
+        elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "questions": len(items), "questions_per_s": round(len(items) / elapsed, 3)}
+
+def bench_lora(args, corpus, questions) -> dict:
+    """Local LoRA generation, one at a time and dynamically batched, against the OpenAI path."""
+    import ask_tina
+    import lora_backend
+    from training_data import latest_adapter
+    adapter = args.lora_adapter or latest_adapter(os.path.join(REPO_ROOT, "tina-lora"))
+    if not adapter:
+        return {"skipped": "no adapter under tina-lora/run-*"}
+    asked = [q["question"] for q in questions[:args.lora_questions]]
+
+    generator = lora_backend.LoraGenerator(adapter)
+    generator.generate_batch(asked[:1])
+    batcher = lora_backend.DynamicBatcher(generator.generate_batch, max_batch=args.lora_batch)
+    results = {"lora": {
+        "single": percentiles([timed(generator.generate_batch, [q]) for q in asked]),
+        "batched": throughput(batcher.submit, asked, args.lora_batch),
+        "unbatched": throughput(lambda q: generator.generate_batch([q]), asked, 1),
+    }}
+
+    live = args.live_openai and os.getenv("OPENAI_API_KEY")
+    if not live:
+        install_openai_stub(args.openai_latency_ms / 1000)
+    # _call_openai skips the answer cache and request coalescing, so every question is a real call.
+    results["openai"] = {
+        "mode": "live" if live else f"stub ({args.openai_latency_ms:g} ms)",
+        "single": percentiles([timed(ask_tina._call_openai, q) for q in asked]),
+        "concurrent": throughput(ask_tina._call_openai, asked, ask_tina.OPENAI_MAX_CONCURRENCY),
+    }
+    return results
+
+def bench_rate_limit(args, corpus, questions) -> dict:
+    from bench_rate_limit import bench
+    from rate_limit import MemoryBackend, SQLiteBackend
+    return {
+        "memory": bench(MemoryBackend(), args.log_rows, 500),
+        "sqlite": bench(SQLiteBackend(os.path.join(os.getcwd(), "limits.db")), args.log_rows, 500),
+    }
+
+SUITES = {
+    "extract": bench_extract,
+    "embed": bench_embed,
+    "search": bench_search,
+    "quantization": bench_quantization,
+    "log_query": bench_log_query,
+    "rate_limit": bench_rate_limit,
+    "ask": bench_ask,
+    "lora": bench_lora,
+}
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return ""
+
+def flatten(data, prefix=""):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix, data
+
+def compare(previous: dict, current: dict):
+    old = dict(flatten(previous.get("results", {})))
+    print(f"{'metric':70} {'before':>12} {'after':>12} {'change':>8}")
+    for key, value in flatten(current.get("results", {})):
+        if key in old and old[key]:
+            change = (value - old[key]) / old[key] * 100
+            print(f"{key:70} {old[key]:>12g} {value:>12g} {change:>+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run TINA performance benchmarks.")
+    parser.add_argument("--suites", default=",".join(SUITES), help="Comma-separated subset of: " + ", ".join(SUITES))
+    parser.add_argument("--sizes", default="1000,100000", help="Index sizes for the search suite, e.g. 1000,100000,1000000")
+    parser.add_argument("--corpus", type=int, default=2000, help="Synthetic passages to generate")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--reps", type=int, default=20)
+    parser.add_argument("--embed-docs", type=int, default=256)
+    parser.add_argument("--log-rows", type=int, default=2000)
+    parser.add_argument("--ask-corpus", type=int, default=1000)
+    parser.add_argument("--openai-latency-ms", type=float, default=800)
+    parser.add_argument("--live-openai", action="store_true", help="Call the real API in the lora suite when OPENAI_API_KEY is set")
+    parser.add_argument("--lora-adapter", help="Adapter folder for the lora suite (default: latest tina-lora/run-*)")
+    parser.add_argument("--lora-questions", type=int, default=16)
+    parser.add_argument("--lora-batch", type=int, default=8)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Previous results file to diff against")
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+
+    output = os.path.abspath(args.output)
+    previous_path = os.path.abspath(args.compare) if args.compare else None
+    corpus = generate_corpus(args.corpus)
+    questions = generate_questions(corpus, max(args.queries, 200))
+
+    workdir = tempfile.mkdtemp(prefix="tina-bench-")
+    os.chdir(workdir)
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "bench.db")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": {},
+    }
+    for name in args.suites.split(","):
+        print(f"▶ {name}", flush=True)
+        try:
+            report["results"][name] = SUITES[name](args, corpus, questions)
+        except ImportError as e:
+            report["results"][name] = {"skipped": f"missing dependency: {e.name}"}
+        except Exception as e:
+            report["results"][name] = {"error": str(e)}
+
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {output}")
+    if previous_path:
+        with open(previous_path, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+# conftest.py
+import os
+
+# auth checks SESSION_SECRET at import; every worker in a test run shares this one.
+os.environ.setdefault("SESSION_SECRET", "test-session-secret")
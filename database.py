@@ -3,6 +3,8 @@ import sqlite3
 import os
 import hashlib
 import csv
+import json
+import re
 from datetime import datetime
 
 DB_PATH = os.getenv("DATABASE_PATH", "query_log.db")
@@ -17,12 +19,19 @@ def init_db():
         c = conn.cursor()
         c.execute("""
         CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT,
             query TEXT,
             context TEXT,
             response TEXT,
             timestamp TEXT DEFAULT CURRENT_TIMESTAMP
         )""")
+        c.execute("PRAGMA table_info(logs)")
+        log_columns = {row[1] for row in c.fetchall()}
+        if "timings" not in log_columns:
+            c.execute("ALTER TABLE logs ADD COLUMN timings TEXT")
+        if "id" not in log_columns:
+            _add_log_ids(c)
         c.execute("""
         CREATE TABLE IF NOT EXISTS summaries (
             hash TEXT PRIMARY KEY,
@@ -35,12 +44,210 @@ def init_db():
             subscription_level TEXT DEFAULT 'free',
             subscription_expires TEXT DEFAULT ''
         )""")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS passages (
+            id INTEGER PRIMARY KEY,
+            text TEXT
+        )""")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS minhash_signatures (
+            doc_hash TEXT PRIMARY KEY,
+            signature BLOB
+        )""")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS minhash_bands (
+            band INTEGER,
+            bucket TEXT,
+            doc_hash TEXT
+        )""")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_minhash_bands ON minhash_bands(band, bucket)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS dropped_documents (
+            doc_hash TEXT PRIMARY KEY,
+            duplicate_of TEXT,
+            dropped_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )""")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS faq_entries (
+            id INTEGER PRIMARY KEY,
+            question TEXT,
+            answer TEXT,
+            source TEXT,
+            citations TEXT,
+            hits INTEGER,
+            embedding BLOB,
+            built_at TEXT
+        )""")
+        c.execute("CREATE TABLE IF NOT EXISTS faq_builds (built_at REAL)")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS faq_aliases (
+            normalized TEXT PRIMARY KEY,
+            faq_id INTEGER
+        )""")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT,
+            source TEXT,
+            label TEXT,
+            queued_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )""")
+        c.execute("PRAGMA table_info(ingest_queue)")
+        queue_columns = {row[1] for row in c.fetchall()}
+        for column, decl in (("path", "TEXT"), ("attempts", "INTEGER DEFAULT 0"), ("digest", "TEXT")):
+            if column not in queue_columns:
+                c.execute(f"ALTER TABLE ingest_queue ADD COLUMN {column} {decl}")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS upload_digests (
+            digest TEXT PRIMARY KEY,
+            source TEXT,
+            recorded_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )""")
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_failed (
+            id INTEGER PRIMARY KEY,
+            text TEXT,
+            source TEXT,
+            label TEXT,
+            path TEXT,
+            attempts INTEGER,
+            error TEXT,
+            failed_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )""")
+        _init_fts(c)
         conn.commit()
 
-def log_query(username: str, query: str, context: str, response: str):
-    sql = "INSERT INTO logs(username, query, context, response) VALUES (?,?,?,?)"
+def _add_log_ids(c: sqlite3.Cursor):
+    """Give logs a stable INTEGER PRIMARY KEY; implicit rowids may be renumbered by VACUUM.
+
+    Existing rows keep their current rowid as id, so training watermarks stay valid.
+    logs_fts is dropped and rebuilt against the new column by _init_fts.
+    """
+    c.execute("DROP TABLE IF EXISTS logs_fts")
+    c.execute("""
+    CREATE TABLE logs_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        query TEXT,
+        context TEXT,
+        response TEXT,
+        timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+        timings TEXT
+    )""")
+    c.execute(
+        "INSERT INTO logs_new(id, username, query, context, response, timestamp, timings) "
+        "SELECT rowid, username, query, context, response, timestamp, timings FROM logs ORDER BY rowid"
+    )
+    c.execute("DROP TABLE logs")  # also drops the old logs_fts triggers
+    c.execute("ALTER TABLE logs_new RENAME TO logs")
+
+def _init_fts(c: sqlite3.Cursor):
+    # External-content FTS5 tables: the text lives once in logs/passages and
+    # the triggers below keep the inverted index in sync with every write.
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name IN ('logs_fts', 'passages_fts')")
+    existing = {row[0] for row in c.fetchall()}
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(
+        query, response, content='logs', content_rowid='id'
+    )""")
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+        text, content='passages', content_rowid='id'
+    )""")
+    c.executescript("""
+    CREATE TRIGGER IF NOT EXISTS logs_fts_ai AFTER INSERT ON logs BEGIN
+        INSERT INTO logs_fts(rowid, query, response) VALUES (new.id, new.query, new.response);
+    END;
+    CREATE TRIGGER IF NOT EXISTS logs_fts_ad AFTER DELETE ON logs BEGIN
+        INSERT INTO logs_fts(logs_fts, rowid, query, response) VALUES ('delete', old.id, old.query, old.response);
+    END;
+    CREATE TRIGGER IF NOT EXISTS logs_fts_au AFTER UPDATE ON logs BEGIN
+        INSERT INTO logs_fts(logs_fts, rowid, query, response) VALUES ('delete', old.id, old.query, old.response);
+        INSERT INTO logs_fts(rowid, query, response) VALUES (new.id, new.query, new.response);
+    END;
+    CREATE TRIGGER IF NOT EXISTS passages_fts_ai AFTER INSERT ON passages BEGIN
+        INSERT INTO passages_fts(rowid, text) VALUES (new.id, new.text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS passages_fts_ad AFTER DELETE ON passages BEGIN
+        INSERT INTO passages_fts(passages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END;
+    CREATE TRIGGER IF NOT EXISTS passages_fts_au AFTER UPDATE ON passages BEGIN
+        INSERT INTO passages_fts(passages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO passages_fts(rowid, text) VALUES (new.id, new.text);
+    END;
+    """)
+    # Backfill rows written before the FTS tables existed.
+    if "logs_fts" not in existing:
+        c.execute("INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')")
+    if "passages_fts" not in existing:
+        c.execute("INSERT INTO passages_fts(passages_fts) VALUES ('rebuild')")
+
+def fts_query(text: str, phrase: bool = False) -> str:
+    """Turn free text into a safe FTS5 MATCH expression.
+
+    By default the terms are quoted and OR-ed together; with ``phrase=True`` they
+    must appear adjacent and in order (e.g. "Sec. 34(L)" -> "sec 34 l").
+    """
+    terms = re.findall(r"\w+", text.lower())
+    if not terms:
+        return ""
+    if phrase:
+        return '"' + " ".join(terms) + '"'
+    return " OR ".join(f'"{t}"' for t in dict.fromkeys(terms))
+
+def log_query(username: str, query: str, context: str, response: str, timings: dict | None = None):
+    sql = "INSERT INTO logs(username, query, context, response, timings) VALUES (?,?,?,?,?)"
+    with get_conn() as conn:
+        conn.execute(sql, (username, query, context, response, json.dumps(timings) if timings else None))
+
+def add_passage(passage_id: int, text: str):
+    sql = "INSERT INTO passages(id, text) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET text = excluded.text"
+    with get_conn() as conn:
+        conn.execute(sql, (passage_id, text))
+
+def add_passages(passages: list[tuple[int, str]]):
+    sql = "INSERT INTO passages(id, text) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET text = excluded.text"
+    with get_conn() as conn:
+        conn.executemany(sql, passages)
+
+def clear_passages():
+    with get_conn() as conn:
+        conn.execute("DELETE FROM passages")
+
+def load_passages() -> list[str]:
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT text FROM passages ORDER BY id")
+        return [row[0] for row in c.fetchall()]
+
+def search_passages(query: str, limit: int = 10, phrase: bool = False) -> list[tuple[int, float]]:
+    """BM25-ranked lexical search over indexed passages; returns (passage_id, score), best first."""
+    match = fts_query(query, phrase=phrase)
+    if not match:
+        return []
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT rowid, -bm25(passages_fts) AS score FROM passages_fts "
+            "WHERE passages_fts MATCH ? ORDER BY score DESC LIMIT ?",
+            (match, limit)
+        )
+        return c.fetchall()
+
+def search_logs(query: str, limit: int = 20) -> list[tuple]:
+    """BM25-ranked search over logged questions and answers; questions weigh double."""
+    match = fts_query(query)
+    if not match:
+        return []
     with get_conn() as conn:
-        conn.execute(sql, (username, query, context, response))
+        c = conn.cursor()
+        c.execute(
+            "SELECT l.id, l.username, l.query, l.response, l.timestamp FROM logs_fts "
+            "JOIN logs l ON l.id = logs_fts.rowid "
+            "WHERE logs_fts MATCH ? ORDER BY bm25(logs_fts, 2.0, 1.0) LIMIT ?",
+            (match, limit)
+        )
+        return c.fetchall()
 
 def store_file_text(filename: str, content: str) -> str:
     hash_digest = hashlib.sha256(content.strip().encode("utf-8")).hexdigest()
@@ -56,6 +263,76 @@ def store_file_text(filename: str, content: str) -> str:
         conn.commit()
     return path
 
+def has_document(hash_digest: str) -> bool:
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM summaries WHERE hash = ?", (hash_digest,))
+        return c.fetchone() is not None
+
+def record_document(hash_digest: str, name: str):
+    with get_conn() as conn:
+        conn.execute("INSERT OR IGNORE INTO summaries (hash, summary) VALUES (?, ?)", (hash_digest, name))
+
+def record_dropped(doc_hash: str, duplicate_of: str | None):
+    """Remember a near-duplicate left out of the index so rebuilds leave it out too."""
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO dropped_documents (doc_hash, duplicate_of) VALUES (?, ?)",
+            (doc_hash, duplicate_of)
+        )
+
+def dropped_hashes() -> set[str]:
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT doc_hash FROM dropped_documents")
+        return {row[0] for row in c.fetchall()}
+
+def has_upload(digest: str) -> bool:
+    """True once the upload with these raw-bytes SHA-256 has been indexed."""
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM upload_digests WHERE digest = ?", (digest,))
+        return c.fetchone() is not None
+
+def record_upload(digest: str, source: str):
+    with get_conn() as conn:
+        conn.execute("INSERT OR IGNORE INTO upload_digests (digest, source) VALUES (?, ?)", (digest, source))
+
+def enqueue_ingest(text: str, source: str, label: str, path: str | None = None, digest: str | None = None):
+    """Hand a document to the index writer process (see index_store.py)."""
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT INTO ingest_queue(text, source, label, path, digest) VALUES (?,?,?,?,?)",
+            (text, source, label, path, digest)
+        )
+
+def pending_ingests(limit: int = 100) -> list[tuple]:
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, text, source, label, path, digest FROM ingest_queue ORDER BY id LIMIT ?", (limit,))
+        return c.fetchall()
+
+def delete_ingest(queue_id: int):
+    with get_conn() as conn:
+        conn.execute("DELETE FROM ingest_queue WHERE id = ?", (queue_id,))
+
+def fail_ingest(queue_id: int, error: str, max_attempts: int):
+    """Count a failed attempt; after ``max_attempts`` move the row to ingest_failed."""
+    with get_conn() as conn:
+        conn.execute("UPDATE ingest_queue SET attempts = COALESCE(attempts, 0) + 1 WHERE id = ?", (queue_id,))
+        conn.execute(
+            "INSERT INTO ingest_failed(id, text, source, label, path, attempts, error) "
+            "SELECT id, text, source, label, path, attempts, ? FROM ingest_queue WHERE id = ? AND attempts >= ?",
+            (error, queue_id, max_attempts)
+        )
+        conn.execute("DELETE FROM ingest_queue WHERE id = ? AND attempts >= ?", (queue_id, max_attempts))
+
+def failed_ingests() -> list[tuple]:
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, source, label, attempts, error, failed_at FROM ingest_failed ORDER BY id")
+        return c.fetchall()
+
 def has_uploaded_knowledge() -> bool:
     with get_conn() as conn:
         c = conn.cursor()
@@ -82,7 +359,7 @@ def view_logs() -> list[tuple]:
 def delete_log_by_id(log_id: int) -> str:
     with get_conn() as conn:
         c = conn.cursor()
-        c.execute("DELETE FROM logs WHERE rowid = ?", (log_id,))
+        c.execute("DELETE FROM logs WHERE id = ?", (log_id,))
         conn.commit()
         return f"Log ID {log_id} deleted."
 
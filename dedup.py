@@ -0,0 +1,164 @@
+# dedup.py
+"""Near-duplicate detection for knowledge passages.
+
+Ingest time: each passage gets a MinHash signature over word shingles; the
+signature is split into LSH bands stored in SQLite, so looking up candidates
+is a handful of indexed selects instead of a scan over every passage.
+
+    python dedup.py    # compact knowledge_files/dynamic and rebuild the index
+"""
+import os
+import re
+import hashlib
+import logging
+import numpy as np
+from database import get_conn, record_dropped
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+
+_MERSENNE = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1337)
+_A = _rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+_B = _rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.strip().encode("utf-8")).hexdigest()
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[str]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def minhash(text: str) -> np.ndarray:
+    tokens = shingles(text)
+    if not tokens:
+        return np.full(NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    # 31-bit shingle hashes keep a * x + b below 2**62, so uint64 never overflows.
+    x = np.array(
+        [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=4).digest(), "little") >> 1 for t in tokens],
+        dtype=np.uint64
+    )
+    return ((np.outer(x, _A) + _B) % _MERSENNE).min(axis=0)
+
+def estimate_similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    return float(np.mean(sig_a == sig_b))
+
+def _band_keys(signature: np.ndarray) -> list[tuple[int, str]]:
+    return [
+        (band, hashlib.md5(signature[band * ROWS:(band + 1) * ROWS].tobytes()).hexdigest())
+        for band in range(BANDS)
+    ]
+
+class MemoryLSH:
+    """In-memory counterpart of the SQLite band store, for batches that should not touch it."""
+
+    def __init__(self, threshold: float = NEAR_DUP_THRESHOLD):
+        self.threshold = threshold
+        self.signatures = []
+        self._buckets = {}
+
+    def find(self, signature: np.ndarray) -> int | None:
+        """Position of an added signature at least ``threshold`` similar, if any."""
+        candidates = {pos for key in _band_keys(signature) for pos in self._buckets.get(key, ())}
+        for pos in sorted(candidates):
+            if estimate_similarity(signature, self.signatures[pos]) >= self.threshold:
+                return pos
+        return None
+
+    def add(self, signature: np.ndarray) -> int:
+        pos = len(self.signatures)
+        self.signatures.append(signature)
+        for key in _band_keys(signature):
+            self._buckets.setdefault(key, []).append(pos)
+        return pos
+
+def find_near_duplicate(text: str, threshold: float = NEAR_DUP_THRESHOLD) -> str | None:
+    """Return the content hash of a stored passage at least ``threshold`` similar, if any."""
+    signature = minhash(text)
+    keys = _band_keys(signature)
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT DISTINCT s.doc_hash, s.signature FROM minhash_bands b "
+            "JOIN minhash_signatures s ON s.doc_hash = b.doc_hash "
+            f"WHERE {' OR '.join(['(b.band = ? AND b.bucket = ?)'] * len(keys))}",
+            [v for key in keys for v in key]
+        )
+        for doc_hash, blob in c.fetchall():
+            if estimate_similarity(signature, np.frombuffer(blob, dtype=np.uint64)) >= threshold:
+                return doc_hash
+    return None
+
+def register_document(text: str, doc_hash: str | None = None) -> str:
+    doc_hash = doc_hash or content_hash(text)
+    signature = minhash(text)
+    with get_conn() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO minhash_signatures(doc_hash, signature) VALUES (?, ?)",
+            (doc_hash, signature.tobytes())
+        )
+        conn.execute("DELETE FROM minhash_bands WHERE doc_hash = ?", (doc_hash,))
+        conn.executemany(
+            "INSERT INTO minhash_bands(band, bucket, doc_hash) VALUES (?, ?, ?)",
+            [(band, bucket, doc_hash) for band, bucket in _band_keys(signature)]
+        )
+    return doc_hash
+
+def clear_signatures():
+    with get_conn() as conn:
+        conn.execute("DELETE FROM minhash_bands")
+        conn.execute("DELETE FROM minhash_signatures")
+
+def compact_dynamic_knowledge(folder: str = os.path.join("knowledge_files", "dynamic")) -> tuple[int, int]:
+    """Drop near-duplicate passages from the index and their text files from ``folder``.
+
+    Passages are visited in index order, so the earliest wording of an answer
+    survives. The signature store is rebuilt along the way. Dropped hashes are
+    recorded, so duplicates kept on disk as stored uploads or static files stay
+    out of later rebuilds. Returns (kept, removed).
+    """
+    import file_utils
+
+    clear_signatures()
+    survivors, kept_hashes, dropped = [], set(), {}
+    for text in file_utils.knowledge_texts:
+        doc_hash = content_hash(text)
+        duplicate = doc_hash if doc_hash in kept_hashes else find_near_duplicate(text)
+        if duplicate:
+            dropped[doc_hash] = duplicate
+            continue
+        register_document(text, doc_hash)
+        kept_hashes.add(doc_hash)
+        survivors.append(text)
+    dropped = {doc_hash: duplicate for doc_hash, duplicate in dropped.items() if doc_hash not in kept_hashes}
+    for doc_hash, duplicate in dropped.items():
+        record_dropped(doc_hash, duplicate)
+
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            if not name.endswith(".txt"):
+                continue
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                if content_hash(f.read()) in dropped:
+                    os.remove(path)
+
+    removed = len(file_utils.knowledge_texts) - len(survivors)
+    file_utils.rebuild_from_texts(survivors)
+    logger.info(f"Compacted knowledge: kept {len(survivors)}, removed {removed}")
+    return len(survivors), removed
+
+if __name__ == "__main__":
+    from database import init_db
+    from file_utils import load_or_create_faiss_index
+    init_db()
+    load_or_create_faiss_index()
+    kept, removed = compact_dynamic_knowledge()
+    print(f"✅ Compaction complete. Kept {kept}, removed {removed} near-duplicates.")
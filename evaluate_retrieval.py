@@ -0,0 +1,95 @@
+# evaluate_retrieval.py
+"""Offline retrieval evaluation built from the ``logs`` table.
+
+Every logged answer that came from the knowledge base (or was learned from
+ChatGPT) is a passage in the index, so each log row gives a question with a
+known set of relevant passage ids. Each retriever configuration is replayed
+over those questions and scored on recall@k and latency.
+
+    python evaluate_retrieval.py --limit 500 --json results.json
+"""
+import argparse
+import json
+import time
+import numpy as np
+from database import get_conn, load_passages
+from file_utils import load_or_create_faiss_index
+from retrieval import hybrid_search
+
+ANSWER_SEPARATOR = "\n\n---\n\n"
+
+# (name, dense_weight, lexical_weight)
+CONFIGURATIONS = [
+    ("dense", 1.0, 0.0),
+    ("bm25", 0.0, 1.0),
+    ("rrf-1:1", 1.0, 1.0),
+    ("rrf-2:1", 2.0, 1.0),
+    ("rrf-1:2", 1.0, 2.0),
+]
+
+def build_eval_set(limit: int = 1000) -> list[tuple[str, set[int]]]:
+    passage_ids = {}
+    for pid, text in enumerate(load_passages()):
+        passage_ids.setdefault(text.strip(), set()).add(pid)
+
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT query, response FROM logs WHERE context IN ('faiss', 'semantic', 'chatgpt') "
+            "ORDER BY rowid DESC LIMIT ?", (limit,)
+        )
+        rows = c.fetchall()
+
+    eval_set = []
+    for query, response in rows:
+        relevant = set()
+        for segment in (response or "").split(ANSWER_SEPARATOR):
+            relevant |= passage_ids.get(segment.strip(), set())
+        if query and relevant:
+            eval_set.append((query, relevant))
+    return eval_set
+
+def evaluate(eval_set: list[tuple[str, set[int]]], ks: tuple[int, ...] = (1, 3, 10)) -> list[dict]:
+    report = []
+    depth = max(ks)
+    for name, dense_weight, lexical_weight in CONFIGURATIONS:
+        hits = {k: 0.0 for k in ks}
+        latencies = []
+        for query, relevant in eval_set:
+            start = time.perf_counter()
+            ids, _ = hybrid_search(query, top_k=depth, dense_weight=dense_weight, lexical_weight=lexical_weight)
+            latencies.append((time.perf_counter() - start) * 1000)
+            for k in ks:
+                hits[k] += len(relevant & set(ids[:k])) / len(relevant)
+        n = max(len(eval_set), 1)
+        report.append({
+            "config": name,
+            "dense_weight": dense_weight,
+            "lexical_weight": lexical_weight,
+            "queries": len(eval_set),
+            **{f"recall@{k}": round(hits[k] / n, 4) for k in ks},
+            "latency_ms_mean": round(float(np.mean(latencies)), 2) if latencies else 0.0,
+            "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2) if latencies else 0.0,
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate TINA retrievers against logged questions.")
+    parser.add_argument("--limit", type=int, default=1000, help="Most recent log rows to use")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    load_or_create_faiss_index()
+    eval_set = build_eval_set(args.limit)
+    if not eval_set:
+        print("❌ No log rows map to indexed passages. Nothing to evaluate.")
+        return
+    report = evaluate(eval_set)
+    for row in report:
+        print(" | ".join(f"{k}={v}" for k, v in row.items()))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
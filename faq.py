@@ -0,0 +1,249 @@
+# faq.py
+"""Precomputed answers for the questions people ask most.
+
+An offline job (``python faq.py``, or the in-app scheduler every
+FAQ_REFRESH_HOURS) clusters logged questions by embedding. Every cluster
+asked at least FAQ_MIN_COUNT times becomes an entry: the most common
+phrasing as the canonical question, the answer given most often, and the
+citations that answer makes. Only answers served from the knowledge base
+(``faiss``) are eligible; generated ones are never replayed unvetted.
+``lookup`` runs in handle_ask before retrieval. Phrasings already seen are
+matched exactly without embedding anything. New phrasings match when they
+land within FAQ_MATCH_DISTANCE (squared L2 on normalized embeddings) of a
+canonical question and name the same citations and numbers: "Form 1701" and
+"Form 1702" embed almost identically but are different questions.
+"""
+import os
+import re
+import json
+import time
+import random
+import logging
+import threading
+from collections import Counter
+import numpy as np
+import file_utils
+from ask_tina import normalize_question
+from database import get_conn
+from retrieval import extract_citations
+
+logger = logging.getLogger(__name__)
+
+FAQ_MIN_COUNT = int(os.getenv("FAQ_MIN_COUNT", "5"))
+FAQ_MAX_ENTRIES = int(os.getenv("FAQ_MAX_ENTRIES", "500"))
+# Only the most frequent phrasings are clustered; the one-off tail cannot form an FAQ on its own.
+FAQ_MINE_PHRASINGS = int(os.getenv("FAQ_MINE_PHRASINGS", "20000"))
+FAQ_CLUSTER_DISTANCE = float(os.getenv("FAQ_CLUSTER_DISTANCE", "0.2"))
+FAQ_MATCH_DISTANCE = float(os.getenv("FAQ_MATCH_DISTANCE", "0.15"))
+FAQ_RELOAD_SECONDS = float(os.getenv("FAQ_RELOAD_SECONDS", "60"))
+FAQ_REFRESH_HOURS = float(os.getenv("FAQ_REFRESH_HOURS", "24"))
+# Spreads scheduled rebuilds so workers sharing the database do not all mine at once.
+FAQ_REFRESH_JITTER = 300.0
+
+# Answers from these sources are eligible; "faq" rows still count towards frequency.
+FAQ_ANSWER_SOURCES = ("faiss",)
+
+def _embed(texts: list[str]) -> np.ndarray:
+    vectors = np.array(file_utils.get_model().encode(texts, convert_to_tensor=False), dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def anchors(question: str) -> frozenset:
+    """Citations and numbers (form numbers, years, sections) a matching question must share."""
+    cited = {re.sub(r"\W+", " ", c.lower()).strip() for c in extract_citations(question)}
+    return frozenset(cited | set(re.findall(r"\d+", question)))
+
+def _is_usable_answer(answer: str) -> bool:
+    return bool(answer) and not answer.startswith(("[ChatGPT Error]", "❌"))
+
+def mine_clusters(min_count: int = FAQ_MIN_COUNT, max_entries: int = FAQ_MAX_ENTRIES,
+                  distance: float = FAQ_CLUSTER_DISTANCE) -> list[dict]:
+    """Group logged questions into clusters of paraphrases, most asked first."""
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT query, response, context FROM logs WHERE query IS NOT NULL")
+        rows = c.fetchall()
+
+    phrasings = {}
+    for query, response, context in rows:
+        key = normalize_question(query)
+        if not key:
+            continue
+        entry = phrasings.setdefault(key, {"question": Counter(), "answers": Counter(), "count": 0})
+        entry["count"] += 1
+        entry["question"][query.strip()] += 1
+        if context in FAQ_ANSWER_SOURCES and _is_usable_answer(response):
+            entry["answers"][(response, context)] += 1
+
+    # Greedy clustering, most frequent phrasing first, so each centre is a popular wording.
+    keys = sorted(phrasings, key=lambda k: phrasings[k]["count"], reverse=True)[:FAQ_MINE_PHRASINGS]
+    if not keys:
+        return []
+    vectors = _embed(keys)
+    centres = np.empty_like(vectors)
+    clusters = []
+    for key, vector in zip(keys, vectors):
+        key_anchors = anchors(key)
+        if clusters:
+            # Unit vectors: squared L2 = 2 - 2 * cosine.
+            distances = 2.0 - 2.0 * (centres[:len(clusters)] @ vector)
+            distances[[c["anchors"] != key_anchors for c in clusters]] = np.inf
+            best = int(np.argmin(distances))
+            if distances[best] <= distance:
+                clusters[best]["members"].append(key)
+                continue
+        centres[len(clusters)] = vector
+        clusters.append({"members": [key], "embedding": vector, "anchors": key_anchors})
+
+    mined = []
+    for cluster in clusters:
+        members = [phrasings[k] for k in cluster["members"]]
+        hits = sum(m["count"] for m in members)
+        answers = sum((m["answers"] for m in members), Counter())
+        if hits < min_count or not answers:
+            continue
+        # Prefer the answer given most often; on a tie, one grounded in the knowledge base.
+        (answer, source), _ = max(answers.items(), key=lambda item: (item[1], item[0][1] == "faiss"))
+        mined.append({
+            "question": members[0]["question"].most_common(1)[0][0],
+            "aliases": cluster["members"],
+            "answer": answer,
+            "source": source,
+            "citations": list(dict.fromkeys(extract_citations(answer))),
+            "hits": hits,
+            "embedding": cluster["embedding"],
+        })
+    mined.sort(key=lambda e: e["hits"], reverse=True)
+    return mined[:max_entries]
+
+def build_faq_index(**kwargs) -> int:
+    """Mine the logs and replace the stored FAQ entries; returns how many were kept."""
+    entries = mine_clusters(**kwargs)
+    now = time.time()
+    built_at = repr(now)
+    with get_conn() as conn:
+        conn.execute("DELETE FROM faq_builds")
+        conn.execute("INSERT INTO faq_builds(built_at) VALUES (?)", (now,))
+        conn.execute("DELETE FROM faq_aliases")
+        conn.execute("DELETE FROM faq_entries")
+        for faq_id, entry in enumerate(entries):
+            conn.execute(
+                "INSERT INTO faq_entries(id, question, answer, source, citations, hits, embedding, built_at) "
+                "VALUES (?,?,?,?,?,?,?,?)",
+                (faq_id, entry["question"], entry["answer"], entry["source"], json.dumps(entry["citations"]),
+                 entry["hits"], entry["embedding"].astype(np.float32).tobytes(), built_at)
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO faq_aliases(normalized, faq_id) VALUES (?, ?)",
+                [(alias, faq_id) for alias in entry["aliases"]]
+            )
+    logger.info(f"FAQ index rebuilt: {len(entries)} entries")
+    _index.reload(force=True)
+    return len(entries)
+
+def last_built_at() -> float:
+    """When any process last rebuilt the entries (0.0 if never), even if none were kept."""
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute("SELECT MAX(built_at) FROM faq_builds")
+        return c.fetchone()[0] or 0.0
+
+def render(entry: dict) -> str:
+    """The entry's answer with the citations it makes listed after it."""
+    if not entry["citations"]:
+        return entry["answer"]
+    return entry["answer"] + "\n\n📚 Sources: " + "; ".join(entry["citations"])
+
+class FaqIndex:
+    """In-memory copy of the stored entries, reloaded when the job rebuilds them."""
+
+    def __init__(self):
+        self.entries, self.aliases = [], {}
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def reload(self, force: bool = False):
+        if not force and time.monotonic() - self._checked_at < FAQ_RELOAD_SECONDS:
+            return
+        self._checked_at = time.monotonic()
+        with get_conn() as conn:
+            c = conn.cursor()
+            c.execute("SELECT MAX(built_at) FROM faq_entries")
+            version = c.fetchone()[0]
+            if version == self.version and not force:
+                return
+            c.execute("SELECT id, question, answer, source, citations, hits, embedding FROM faq_entries ORDER BY id")
+            rows = c.fetchall()
+            c.execute("SELECT normalized, faq_id FROM faq_aliases")
+            aliases = dict(c.fetchall())
+        entries = [
+            {"id": r[0], "question": r[1], "answer": r[2], "source": r[3], "citations": json.loads(r[4]), "hits": r[5],
+             "anchors": anchors(r[1])}
+            for r in rows
+        ]
+        embeddings = np.vstack([np.frombuffer(r[6], dtype=np.float32) for r in rows]) if rows else np.zeros((0, 0), np.float32)
+        with self._lock:
+            self.entries, self.aliases, self.embeddings, self.version = entries, aliases, embeddings, version
+
+    def lookup(self, question: str, max_distance: float = FAQ_MATCH_DISTANCE) -> dict | None:
+        self.reload()
+        with self._lock:
+            entries, aliases, embeddings = self.entries, self.aliases, self.embeddings
+        if not entries:
+            return None
+        faq_id = aliases.get(normalize_question(question))
+        if faq_id is not None:
+            return entries[faq_id]
+        vector = file_utils.encode_query(question)[0]
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        distances = np.sum((embeddings - vector) ** 2, axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > max_distance or entries[best]["anchors"] != anchors(question):
+            return None
+        return entries[best]
+
+_index = FaqIndex()
+
+def lookup(question: str) -> dict | None:
+    """Precomputed answer for ``question``, or None to continue with retrieval."""
+    try:
+        return _index.lookup(question)
+    except Exception as e:
+        logger.warning(f"FAQ lookup failed: {e}")
+        return None
+
+def refresh_if_due(hours: float = FAQ_REFRESH_HOURS) -> float:
+    """Rebuild once the last build, by any process sharing the database, is ``hours`` old.
+
+    Returns how long to wait before checking again.
+    """
+    due_in = hours * 3600 - (time.time() - last_built_at())
+    if due_in > 0:
+        return due_in + random.uniform(0, FAQ_REFRESH_JITTER)
+    if file_utils.wait_until_ready(None):
+        try:
+            build_faq_index()
+        except Exception as e:
+            logger.error(f"FAQ rebuild failed: {e}")
+    return hours * 3600
+
+def start_refresher(hours: float = FAQ_REFRESH_HOURS) -> threading.Thread | None:
+    """Serve the stored entries now and rebuild them every ``hours`` in a background thread (0 disables)."""
+    if hours <= 0:
+        return None
+
+    def loop():
+        _index.reload(force=True)
+        while True:
+            time.sleep(refresh_if_due(hours))
+
+    thread = threading.Thread(target=loop, name="tina-faq", daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == "__main__":
+    from database import init_db
+    init_db()
+    count = build_faq_index()
+    print(f"✅ FAQ index rebuilt with {count} entries.")
@@ -1,18 +1,24 @@
 import os
-import shutil
+import hashlib
+import tempfile
 import mimetypes
 import logging
 import re
-import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from PIL import Image
-import pytesseract
-import fitz  # PyMuPDF
-import pdfplumber
-import docx
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from database import (
+    add_passage, add_passages, clear_passages, load_passages, has_document, record_document,
+    has_upload, record_upload, record_dropped, dropped_hashes,
+    enqueue_ingest, pending_ingests, delete_ingest, fail_ingest
+)
+from rerank import RERANK_ENABLED, RERANK_CANDIDATES, rerank, get_cross_encoder
+from dedup import find_near_duplicate, register_document, content_hash
+from metrics import EMBEDDING_CACHE, Gauge, stage
+from vector_store import INDEX_TYPE, build_index, built_type, index_type_of, needs_retrain, retrain, write_index, wrap_loaded
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,14 +32,111 @@ ALLOWED_MIME_PREFIXES = {
 }
 
 EMBED_MODEL_PATH = os.getenv("EMBED_MODEL_PATH", "sentence-transformers/all-MiniLM-L6-v2")
-model = SentenceTransformer(EMBED_MODEL_PATH)
+# Loaded on first use (or by the warm-up thread) so importing this module stays cheap.
+model = None
+_model_lock = threading.Lock()
+
+KNOWLEDGE_DIR = "knowledge_files"
+DYNAMIC_DIR = os.path.join(KNOWLEDGE_DIR, "dynamic")
+# Uploads in progress; same filesystem as DYNAMIC_DIR so finishing one is a rename.
+PARTIAL_DIR = os.path.join(DYNAMIC_DIR, ".partial")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 INDEX_FILE = "faiss_index.idx"
+VECTORS_FILE = "index_vectors.f32"  # full-precision vectors for compressed INDEX_TYPEs
 VERSION_FILE = "index_version.txt"
 CURRENT_VERSION = "v1.0.0"
 
+# single: this process owns the index (default). writer: owns it and publishes
+# shared generations. reader: serves the writer's memory-mapped generation and
+# queues uploads for it. See index_store.py.
+SERVING_MODE = os.getenv("TINA_SERVING_MODE", "single")
+# Queued uploads that fail this many times move to the ingest_failed table.
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+
 index = None
 knowledge_texts = []
+_ingest_lock = threading.Lock()
+_shared_reader = None
+_publish_deferred = False
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+_query_embeddings = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+Gauge("tina_index_passages", "Passages in the FAISS index.", lambda: len(knowledge_texts))
+
+_ready = threading.Event()
+_warmup_error = None
+_warmup_seconds = None
+
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(EMBED_MODEL_PATH)
+    return model
+
+def encode_query(query: str) -> np.ndarray:
+    """Embedding of ``query`` as a (1, dim) float32 array, LRU-cached for repeat questions."""
+    with _query_embeddings_lock:
+        cached = _query_embeddings.get(query)
+        if cached is not None:
+            _query_embeddings.move_to_end(query)
+    if cached is not None:
+        EMBEDDING_CACHE.inc("hit")
+        return cached
+    EMBEDDING_CACHE.inc("miss")
+    with stage("embed"):
+        vector = np.array(get_model().encode([query], convert_to_tensor=False), dtype=np.float32)
+    with _query_embeddings_lock:
+        _query_embeddings[query] = vector
+        while len(_query_embeddings) > QUERY_EMBED_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return vector
+
+def warm_up():
+    """Load the embedding model and FAISS index; safe to call more than once."""
+    global _warmup_error, _warmup_seconds
+    start = time.perf_counter()
+    try:
+        get_model()
+        load_or_create_faiss_index()
+        if RERANK_ENABLED:
+            get_cross_encoder()
+        _warmup_seconds = time.perf_counter() - start
+        logger.info(f"Warm-up complete in {_warmup_seconds:.1f}s ({len(knowledge_texts)} passages)")
+        _ready.set()
+    except Exception as e:
+        _warmup_error = e
+        logger.error(f"Warm-up failed: {e}")
+        return
+    # Retrieval is already serving; load the local answer model before the first miss needs it.
+    from ask_tina import ANSWER_BACKEND
+    if ANSWER_BACKEND == "lora":
+        import lora_backend
+        lora_backend.warm_up()
+
+def start_warmup() -> threading.Thread:
+    thread = threading.Thread(target=warm_up, name="tina-warmup", daemon=True)
+    thread.start()
+    return thread
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+def wait_until_ready(timeout: float | None = None) -> bool:
+    return _ready.wait(timeout)
+
+def readiness() -> dict:
+    return {
+        "ready": _ready.is_set(),
+        "error": str(_warmup_error) if _warmup_error else None,
+        "warmup_seconds": round(_warmup_seconds, 2) if _warmup_seconds is not None else None,
+        "passages": len(knowledge_texts),
+    }
 
 def is_valid_file(file_path: str) -> bool:
     ext = Path(file_path).suffix.lower()
@@ -63,18 +166,24 @@ def extract_text_from_file(file_path: str) -> str:
                 text = f.read()
 
         elif ext == ".pdf":
+            # Extractors are imported per format so startup never pays for them.
             try:
+                import fitz  # PyMuPDF
                 with fitz.open(file_path) as doc:
                     text = "\n".join(page.get_text() for page in doc)
             except Exception:
+                import pdfplumber
                 with pdfplumber.open(file_path) as pdf:
                     text = "\n".join([page.extract_text() or "" for page in pdf.pages])
 
         elif ext in [".jpg", ".jpeg", ".png"]:
+            from PIL import Image
+            import pytesseract
             image = Image.open(file_path)
             text = pytesseract.image_to_string(image)
 
         elif ext == ".docx":
+            import docx
             doc = docx.Document(file_path)
             text = "\n".join(paragraph.text for paragraph in doc.paragraphs)
 
@@ -86,94 +195,260 @@ def extract_text_from_file(file_path: str) -> str:
 def sanitize_filename(filename: str) -> str:
     return re.sub(r'[^a-zA-Z0-9_.-]', '_', filename)
 
+@contextmanager
+def _open_upload(file):
+    """Binary stream over the upload shapes Gradio and callers hand us."""
+    if hasattr(file, 'file') and hasattr(file.file, 'read'):
+        file.file.seek(0)
+        yield file.file
+    elif hasattr(file, 'read'):
+        try:
+            file.seek(0)
+        except Exception:
+            pass
+        yield file
+    else:
+        path = getattr(file, 'path', None) or (file if isinstance(file, str) else getattr(file, 'name', None))
+        if not path or not os.path.exists(path):
+            raise ValueError(f"Unsupported file object type: {type(file)}")
+        with open(path, "rb") as f:
+            yield f
+
+def store_content_addressed(tmp_path: str, digest: str, ext: str) -> str:
+    """Move a fully written upload to DYNAMIC_DIR/<sha256><ext>; identical content is kept once."""
+    filepath = os.path.join(DYNAMIC_DIR, f"{digest}{ext.lower()}")
+    if os.path.exists(filepath):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, filepath)
+    return filepath
+
 def save_file(file) -> tuple[str, str, str]:
-    filename = sanitize_filename(getattr(file, 'name', 'uploaded_file'))
-    folder = os.path.join("knowledge_files", "dynamic")
-    os.makedirs(folder, exist_ok=True)
-
-    base, ext = os.path.splitext(filename)
-    counter = 1
-    filepath = os.path.join(folder, filename)
-    while os.path.exists(filepath):
-        filename = f"{base}_{counter}{ext}"
-        filepath = os.path.join(folder, filename)
-        counter += 1
+    """Stream an upload to disk, hashing it on the way.
 
+    Returns (path, sha256, error). Files are stored under their content hash,
+    so saving the same bytes twice yields the same path and no second copy.
+    """
+    name = getattr(file, 'name', None) or (file if isinstance(file, str) else 'uploaded_file')
+    ext = Path(sanitize_filename(os.path.basename(name))).suffix
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=PARTIAL_DIR, suffix=".part")
     try:
-        if hasattr(file, 'file') and hasattr(file.file, 'read'):
-            file.file.seek(0)
-            with open(filepath, "wb") as f:
-                shutil.copyfileobj(file.file, f)
-        elif hasattr(file, 'read'):
-            try:
-                file.seek(0)
-            except Exception:
-                pass
-            with open(filepath, "wb") as f:
-                f.write(file.read())
-        elif hasattr(file, 'path') and os.path.exists(file.path):
-            if not os.path.samefile(file.path, filepath):
-                shutil.copy(file.path, filepath)
-        elif isinstance(file, str) and os.path.exists(file):
-            shutil.copy(file, filepath)
-        else:
-            raise ValueError(f"Unsupported file object type: {type(file)}")
-
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out, _open_upload(file) as src:
+            for chunk in iter(lambda: src.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                out.write(chunk)
+        filepath = store_content_addressed(tmp_path, digest.hexdigest(), ext)
         logger.info(f"Saved file to: {filepath} ({os.path.getsize(filepath)} bytes)")
-        return filepath, filename, ""
+        return filepath, digest.hexdigest(), ""
     except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         logger.error(f"Failed to save uploaded file: {e}")
-        return "", filename, f"Error saving file: {e}"
+        return "", "", f"Error saving file: {e}"
+
+def snapshot():
+    """(index, passages) to search, taken together so a generation swap never splits them."""
+    global index, knowledge_texts
+    if _shared_reader is not None:
+        current = _shared_reader.current()
+        if current is not None:
+            index, knowledge_texts = current.index, current.passages
+            return current.index, current.passages
+    return index, knowledge_texts
 
 def index_document(text: str):
     global knowledge_texts, index
     if not text:
         return
-    embedding = model.encode([text], convert_to_tensor=False)
+    with stage("embed_document"):
+        embedding = np.array(get_model().encode([text], convert_to_tensor=False), dtype=np.float32)
     knowledge_texts.append(text)
     if index is None:
-        index = faiss.IndexFlatL2(len(embedding[0]))
-    index.add(np.array(embedding, dtype=np.float32))
-    persist_faiss_index()
+        index = build_index(embedding, VECTORS_FILE)
+    else:
+        index.add(embedding)
+        if needs_retrain(index):
+            # A PQ index starts as sq8; train the real one once there are enough vectors.
+            with stage("retrain_index"):
+                index = retrain(index, VECTORS_FILE)
+    # FAISS position doubles as the passage id so lexical hits map back to vectors.
+    add_passage(len(knowledge_texts) - 1, text)
+    with stage("persist_index"):
+        persist_faiss_index()
+
+def ingest_document(text: str, source: str = "", label: str = "dynamic", path: str | None = None,
+                    digest: str | None = None) -> tuple[str, bool]:
+    """Store, embed and index ``text`` exactly once, keyed by its SHA-256.
+
+    ``path`` is the file already holding the document (a stored upload); only
+    text without one is written to DYNAMIC_DIR, so each document is on disk once.
+    ``digest`` is that upload's raw-bytes hash, queued with the text in reader
+    mode so the writer records it once indexing succeeds.
+    Returns (content_hash, is_new). Content already ingested, or a near-duplicate
+    of it, is left alone and reported as not new. Empty text returns ("", False).
+    """
+    text = text.strip()
+    if not text:
+        return "", False
+    doc_hash = content_hash(text)
+    if SERVING_MODE == "reader":
+        if has_document(doc_hash):
+            return doc_hash, False
+        enqueue_ingest(text, source, label, path, digest)
+        return doc_hash, True
+    with _ingest_lock:
+        if has_document(doc_hash):
+            return doc_hash, False
+        duplicate = find_near_duplicate(text)
+        if duplicate:
+            logger.info(f"Skipping near-duplicate of {duplicate[:12]}")
+            record_dropped(doc_hash, duplicate)
+            return duplicate, False
+        filepath = path
+        if not filepath:
+            os.makedirs(DYNAMIC_DIR, exist_ok=True)
+            filepath = os.path.join(DYNAMIC_DIR, f"{label}_{doc_hash}.txt")
+            if not os.path.exists(filepath):
+                with open(filepath, "w", encoding="utf-8") as f:
+                    f.write(text)
+        index_document(text)
+        register_document(text, doc_hash)
+        record_document(doc_hash, source or os.path.basename(filepath))
+    return doc_hash, True
+
+def ingest_upload(path: str, digest: str, source: str) -> tuple[str, bool]:
+    """Index an upload stored by ``save_file``/``finish_upload``; returns (content_hash, is_new).
+
+    content_hash is "" when no text could be extracted, so callers can tell a
+    blank or failed scan from a duplicate.
+
+    Bytes already indexed are skipped without running extraction or OCR again.
+    The digest is recorded only once the text is in the index; in reader mode
+    the writer records it after draining the queued document.
+    """
+    if has_upload(digest):
+        return digest, False
+    text = extract_text_from_file(path)
+    doc_hash, is_new = ingest_document(text, source=source, label="upload", path=path, digest=digest)
+    if text and not (is_new and SERVING_MODE == "reader"):
+        record_upload(digest, source)
+    return doc_hash, is_new
+
+def drain_ingest_queue(limit: int = 100) -> int:
+    """Ingest documents queued by reader processes; returns how many succeeded. Writer only.
+
+    A failed document stays queued for another attempt and moves to the
+    ingest_failed table after INGEST_MAX_ATTEMPTS.
+    """
+    global _publish_deferred
+    rows = pending_ingests(limit)
+    ingested = 0
+    # One generation per batch rather than one per document.
+    _publish_deferred = True
+    try:
+        for queue_id, text, source, label, path, digest in rows:
+            try:
+                ingest_document(text, source=source, label=label, path=path)
+                if digest:
+                    record_upload(digest, source)
+            except Exception as e:
+                logger.error(f"Failed to ingest queued document {queue_id}: {e}")
+                fail_ingest(queue_id, str(e), INGEST_MAX_ATTEMPTS)
+                continue
+            delete_ingest(queue_id)
+            ingested += 1
+    finally:
+        _publish_deferred = False
+    return ingested
+
+def publish_current() -> int:
+    from index_store import publish_generation
+    return publish_generation(index, list(knowledge_texts))
 
 def learn_from_text(content: str, label: str = "dynamic") -> None:
-    if not content.strip():
-        return
     try:
-        filename = f"{label}_{hashlib.sha256(content.encode()).hexdigest()}.txt"
-        folder = os.path.join("knowledge_files", "dynamic")
-        os.makedirs(folder, exist_ok=True)
-        filepath = os.path.join(folder, filename)
-        if not os.path.exists(filepath):
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(content)
-        index_document(content)
+        ingest_document(content, label=label)
     except Exception as e:
         logger.error(f"Failed to learn from text: {e}")
 
+def rebuild_from_texts(texts: list[str]):
+    """Replace the index and passage store with ``texts``, embedded in one batch."""
+    global index, knowledge_texts
+    index = None
+    knowledge_texts = []
+    clear_passages()
+    texts = [t for t in texts if t]
+    if texts:
+        embeddings = np.array(get_model().encode(texts, convert_to_tensor=False), dtype=np.float32)
+        index = build_index(embeddings, VECTORS_FILE)
+        knowledge_texts = list(texts)
+        add_passages(list(enumerate(knowledge_texts)))
+    persist_faiss_index()
+
 def semantic_search(query: str, top_k: int = 3) -> list[str]:
-    if index is None:
+    search_index, passages = snapshot()
+    if search_index is None:
         raise RuntimeError("FAISS index is not initialized.")
-    query_vec = model.encode([query], convert_to_tensor=False)
-    scores, indices = index.search(np.array(query_vec, dtype=np.float32), top_k)
-    return [knowledge_texts[i] for i in indices[0] if i < len(knowledge_texts)]
+    depth = max(top_k, RERANK_CANDIDATES) if RERANK_ENABLED else top_k
+    query_vec = encode_query(query)
+    with stage("faiss_search"):
+        scores, indices = search_index.search(query_vec, depth)
+    results = [passages[i] for i in indices[0] if 0 <= i < len(passages)]
+    if RERANK_ENABLED:
+        results = [results[i] for i in rerank(query, results, top_k=top_k)]
+    return results[:top_k]
+
+def index_version(index_type: str | None = None) -> str:
+    """Version tag naming the index type built; defaults to what INDEX_TYPE builds for the current passages.
+
+    Switching INDEX_TYPE therefore invalidates the stored index and triggers a rebuild.
+    """
+    index_type = index_type or built_type(INDEX_TYPE, len(knowledge_texts))
+    return CURRENT_VERSION if index_type == "flat" else f"{CURRENT_VERSION}+{index_type}"
 
 def persist_faiss_index():
-    if index:
-        faiss.write_index(index, INDEX_FILE)
+    if index is not None:
+        write_index(index, INDEX_FILE)
         with open(VERSION_FILE, "w") as f:
-            f.write(CURRENT_VERSION)
+            f.write(index_version(index_type_of(index)))
+    if SERVING_MODE == "writer" and not _publish_deferred:
+        publish_current()
 
 def load_or_create_faiss_index(skip_versioning: bool = False):
-    global index, knowledge_texts
+    # Holding the ingest lock keeps an early upload from indexing into a half-loaded index.
+    with _ingest_lock:
+        _load_or_create_faiss_index(skip_versioning)
+
+def _load_or_create_faiss_index(skip_versioning: bool):
+    global index, knowledge_texts, _shared_reader
+    if SERVING_MODE == "reader":
+        from index_store import SharedIndexReader
+        _shared_reader = SharedIndexReader()
+        snapshot()
+        if index is None:
+            logger.warning("No index generation published yet; start `python index_store.py writer`.")
+        return
+    import faiss
     if os.path.exists(INDEX_FILE):
         try:
-            index = faiss.read_index(INDEX_FILE)
+            index = wrap_loaded(faiss.read_index(INDEX_FILE), VECTORS_FILE)
+            knowledge_texts = load_passages()
+            if index is None or len(knowledge_texts) != index.ntotal:
+                logger.warning("Passage store out of sync with FAISS index. Rebuilding index.")
+                rebuild_index()
+                return
             if not skip_versioning:
                 with open(VERSION_FILE, "r") as f:
-                    if f.read().strip() != CURRENT_VERSION:
-                        logger.warning("Index version mismatch. Rebuilding index.")
-                        rebuild_index()
+                    stored = f.read().strip()
+                if stored != index_version() and stored == index_version(index_type_of(index)) and needs_retrain(index):
+                    logger.info("Enough passages to train the configured index type. Retraining.")
+                    index = retrain(index, VECTORS_FILE)
+                    persist_faiss_index()
+                elif stored != index_version():
+                    logger.warning("Index version mismatch. Rebuilding index.")
+                    rebuild_index()
         except Exception as e:
             logger.warning(f"Failed to load FAISS index: {e}, rebuilding...")
             rebuild_index()
@@ -181,12 +456,16 @@ def load_or_create_faiss_index(skip_versioning: bool = False):
         rebuild_index()
 
 def rebuild_index():
-    global index, knowledge_texts
-    index = None
-    knowledge_texts = []
-    os.makedirs("knowledge_files", exist_ok=True)
-    for filename in os.listdir("knowledge_files"):
-        path = os.path.join("knowledge_files", filename)
-        if is_valid_file(path):
+    os.makedirs(KNOWLEDGE_DIR, exist_ok=True)
+    paths = [os.path.join(KNOWLEDGE_DIR, name) for name in sorted(os.listdir(KNOWLEDGE_DIR))]
+    if os.path.isdir(DYNAMIC_DIR):
+        paths += [os.path.join(DYNAMIC_DIR, name) for name in sorted(os.listdir(DYNAMIC_DIR))]
+    # Older trees stored uploads both raw and as text; the shared hash indexes them once.
+    # Near-duplicates dropped at ingest or by dedup.py stay on disk but out of the index.
+    texts, dropped = {}, dropped_hashes()
+    for path in paths:
+        if os.path.isfile(path) and is_valid_file(path):
             text = extract_text_from_file(path)
-            index_document(text)
\ No newline at end of file
+            if text and content_hash(text) not in dropped:
+                texts.setdefault(content_hash(text), text)
+    rebuild_from_texts(list(texts.values()))
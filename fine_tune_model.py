@@ -1,7 +1,6 @@
 import os
 import torch
 import random
-import sqlite3
 from datetime import datetime
 from datasets import Dataset
 from transformers import (
@@ -12,7 +11,11 @@ from transformers import (
     DataCollatorForLanguageModeling,
     BitsAndBytesConfig
 )
-from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+from peft import LoraConfig, PeftModel, get_peft_model, prepare_model_for_kbit_training
+from training_data import BASE_MODEL, LORA_DIR, data_dir, latest_adapter, prepare_increment, commit_increment
+
+MAX_LENGTH = 256
+TRAIN_BATCH_SIZE = int(os.getenv("TRAIN_BATCH_SIZE", "8"))
 
 # Set seed for reproducibility
 random.seed(42)
@@ -21,46 +24,25 @@ torch.manual_seed(42)
 # Create logs directory
 os.makedirs("logs", exist_ok=True)
 
-def load_logs():
-    conn = sqlite3.connect("query_log.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT query, response FROM logs
-        WHERE context IN ('semantic', 'lora', 'chatgpt')
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-    return [f"Q: {q}\nA: {a}" for q, a in rows if q and a and len(q) > 8 and len(a) > 10]
-
-def train():
-    qa_texts = load_logs()
-    if not qa_texts:
-        print("❌ No Q&A pairs found. Aborting training.")
-        return
-
-    dataset = Dataset.from_dict({"text": qa_texts})
-    tokenizer = AutoTokenizer.from_pretrained("tiiuae/falcon-rw-1b")
-
-    def tokenize(example):
-        return tokenizer(example["text"], truncation=True, padding="max_length", max_length=256)
-
-    dataset = dataset.map(tokenize)
-
+def load_base_model():
+    # 4-bit loading needs CUDA; weekly CPU runs train the LoRA on full-precision weights.
+    if not torch.cuda.is_available():
+        return AutoModelForCausalLM.from_pretrained(BASE_MODEL, torch_dtype=torch.float32)
     bnb_config = BitsAndBytesConfig(
         load_in_4bit=True,
         bnb_4bit_compute_dtype=torch.float16,
         bnb_4bit_use_double_quant=True,
         bnb_4bit_quant_type="nf4"
     )
-
     model = AutoModelForCausalLM.from_pretrained(
-        "tiiuae/falcon-rw-1b",
+        BASE_MODEL,
         quantization_config=bnb_config,
         device_map="auto"
     )
     model.gradient_checkpointing_enable()
-    model = prepare_model_for_kbit_training(model)
+    return prepare_model_for_kbit_training(model)
 
+def get_lora_model(model):
     peft_config = LoraConfig(
         r=16,
         lora_alpha=32,
@@ -70,16 +52,50 @@ def train():
         task_type="CAUSAL_LM"
     )
 
-    model = get_peft_model(model, peft_config)
+    return get_peft_model(model, peft_config)
+
+def train():
+    tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    def tokenize(texts):
+        return tokenizer(texts, truncation=True, max_length=MAX_LENGTH)["input_ids"]
+
+    folder = data_dir(BASE_MODEL, MAX_LENGTH)
+    increment = prepare_increment(tokenize, folder)
+    if increment is None:
+        print("❌ No new Q&A pairs since the last run. Aborting training.")
+        return
+    if not increment["new"]:
+        commit_increment(folder, increment)
+        print("ℹ️ New logs only repeat pairs already trained on. Nothing to do.")
+        return
+
+    sequences = increment["sequences"]
+    # No padding here: the collator pads each batch to its longest example and
+    # group_by_length keeps examples of similar length in the same batch.
+    dataset = Dataset.from_dict({"input_ids": sequences, "length": [len(s) for s in sequences]})
+
+    model = load_base_model()
+    previous = latest_adapter()
+    if previous:
+        print(f"Continuing from adapter '{previous}'")
+        model = PeftModel.from_pretrained(model, previous, is_trainable=True)
+        model.print_trainable_parameters()
+    else:
+        model = get_lora_model(model)
 
     run_id = datetime.now().strftime("run-%Y%m%d-%H%M%S")
-    output_dir = os.path.join("tina-lora", run_id)
+    output_dir = os.path.join(LORA_DIR, run_id)
     os.makedirs(output_dir, exist_ok=True)
 
     args = TrainingArguments(
         output_dir=output_dir,
-        per_device_train_batch_size=1,
-        gradient_accumulation_steps=4,
+        per_device_train_batch_size=TRAIN_BATCH_SIZE,
+        gradient_accumulation_steps=1,
+        group_by_length=True,
+        length_column_name="length",
         logging_dir="logs",
         num_train_epochs=3,
         learning_rate=2e-4,
@@ -93,13 +109,14 @@ def train():
         model=model,
         train_dataset=dataset,
         args=args,
-        data_collator=DataCollatorForLanguageModeling(tokenizer, mlm=False)
+        data_collator=DataCollatorForLanguageModeling(tokenizer, mlm=False, pad_to_multiple_of=8)
     )
 
     trainer.train()
     model.save_pretrained(output_dir)
     tokenizer.save_pretrained(output_dir)
-    print(f"\u2705 Weekly fine-tuning complete. Model saved to '{output_dir}'")
+    commit_increment(folder, increment)
+    print(f"\u2705 Weekly fine-tuning complete on {increment['new']} new pairs. Model saved to '{output_dir}'")
 
 if __name__ == "__main__":
     train()
@@ -0,0 +1,205 @@
+# index_store.py
+"""Generation-numbered, read-only index snapshots shared across worker processes.
+
+Layout under INDEX_STORE_DIR::
+
+    gen-00000007/meta.json      vector dimension and count
+    gen-00000007/vectors.f32    float32 vectors, memory-mapped by readers
+    gen-00000007/index.faiss    compressed FAISS index (non-flat INDEX_TYPEs only)
+    gen-00000007/passages.bin   UTF-8 passage texts, concatenated
+    gen-00000007/offsets.npy    int64 byte offsets into passages.bin (n + 1 entries)
+    CURRENT                     name of the live generation, replaced atomically
+
+One writer process builds the index and calls ``publish_generation``; every
+reader maps the live generation read-only. A flat index is searched straight
+from the mapped vectors (faiss would copy them into each reader's heap), so
+the OS page cache holds a single copy no matter how many workers run. With a
+compressed INDEX_TYPE each reader loads the compressed codes and shares the
+mapped vectors used for re-scoring. Readers poll CURRENT at most every
+INDEX_REFRESH_SECONDS and swap to a new generation in one assignment.
+
+    python index_store.py writer    # run the single writer (drains queued uploads)
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+import numpy as np
+from vector_store import MappedFlatIndex, RescoringIndex, VectorFile, write_index, wrap_loaded
+
+logger = logging.getLogger(__name__)
+
+INDEX_STORE_DIR = os.getenv("INDEX_STORE_DIR", "index_store")
+INDEX_REFRESH_SECONDS = float(os.getenv("INDEX_REFRESH_SECONDS", "2"))
+INDEX_STORE_KEEP = int(os.getenv("INDEX_STORE_KEEP", "3"))
+WRITER_POLL_SECONDS = float(os.getenv("WRITER_POLL_SECONDS", "1"))
+OPEN_ATTEMPTS = 3
+
+CURRENT_FILE = "CURRENT"
+
+class PassageStore:
+    """Read-only sequence of passages backed by memory-mapped files."""
+
+    def __init__(self, folder: str):
+        self._offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+        size = int(self._offsets[-1]) if len(self._offsets) else 0
+        path = os.path.join(folder, "passages.bin")
+        self._data = np.memmap(path, dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, i: int) -> str:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._data[int(self._offsets[i]):int(self._offsets[i + 1])].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+class Snapshot:
+    def __init__(self, generation: int, index, passages: PassageStore):
+        self.generation = generation
+        self.index = index
+        self.passages = passages
+
+def _generation_name(generation: int) -> str:
+    return f"gen-{generation:08d}"
+
+def current_generation(store_dir: str = INDEX_STORE_DIR) -> int:
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), "r") as f:
+            return int(f.read().strip().split("-")[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def publish_generation(index, texts: list[str], store_dir: str = INDEX_STORE_DIR) -> int:
+    """Write ``index`` and ``texts`` as a new generation and make it live. Writer only."""
+    os.makedirs(store_dir, exist_ok=True)
+    generation = current_generation(store_dir) + 1
+    final = os.path.join(store_dir, _generation_name(generation))
+    staging = final + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    if index is not None:
+        vectors_path = os.path.join(staging, "vectors.f32")
+        if isinstance(index, RescoringIndex):
+            write_index(index, os.path.join(staging, "index.faiss"))
+            shutil.copyfile(index.vectors.path, vectors_path)
+        else:
+            VectorFile(vectors_path, index.d).write(index.reconstruct_n(0, index.ntotal))
+        with open(os.path.join(staging, "meta.json"), "w") as f:
+            json.dump({"dim": index.d, "ntotal": index.ntotal}, f)
+    encoded = [t.encode("utf-8") for t in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    with open(os.path.join(staging, "passages.bin"), "wb") as f:
+        for chunk in encoded:
+            f.write(chunk)
+    np.save(os.path.join(staging, "offsets.npy"), offsets)
+    os.rename(staging, final)
+
+    pointer = os.path.join(store_dir, CURRENT_FILE + ".tmp")
+    with open(pointer, "w") as f:
+        f.write(_generation_name(generation))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(store_dir, CURRENT_FILE))
+    _prune(store_dir, generation)
+    logger.info(f"Published index generation {generation} ({len(texts)} passages)")
+    return generation
+
+def _prune(store_dir: str, live: int):
+    # Readers still holding an older generation keep their mappings; unlinking is safe.
+    # A reader that read CURRENT just before a prune retries (see SharedIndexReader.refresh).
+    for name in os.listdir(store_dir):
+        if name.startswith("gen-") and not name.endswith(".tmp"):
+            try:
+                generation = int(name.split("-")[1])
+            except ValueError:
+                continue
+            if generation <= live - INDEX_STORE_KEEP:
+                shutil.rmtree(os.path.join(store_dir, name), ignore_errors=True)
+
+def open_generation(generation: int, store_dir: str = INDEX_STORE_DIR) -> Snapshot:
+    """Map a published generation; every file is opened here, so a later prune cannot break it."""
+    folder = os.path.join(store_dir, _generation_name(generation))
+    passages = PassageStore(folder)
+    index = None
+    meta_path = os.path.join(folder, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        vectors_path = os.path.join(folder, "vectors.f32")
+        index_path = os.path.join(folder, "index.faiss")
+        if os.path.exists(index_path):
+            import faiss
+            index = wrap_loaded(faiss.read_index(index_path), vectors_path)
+            if index is None:
+                raise RuntimeError(f"Generation {generation} has {index_path} without matching vectors.")
+            if index.ntotal:
+                index.vectors.matrix()
+        else:
+            index = MappedFlatIndex(VectorFile(vectors_path, meta["dim"]))
+    return Snapshot(generation, index, passages)
+
+class SharedIndexReader:
+    def __init__(self, store_dir: str = INDEX_STORE_DIR, refresh_seconds: float = INDEX_REFRESH_SECONDS):
+        self.store_dir = store_dir
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> Snapshot | None:
+        """Swap to the live generation if it changed since the last check."""
+        self._checked_at = time.monotonic()
+        with self._lock:
+            for _ in range(OPEN_ATTEMPTS):
+                generation = current_generation(self.store_dir)
+                if not generation or (self._snapshot is not None and generation == self._snapshot.generation):
+                    break
+                try:
+                    self._snapshot = open_generation(generation, self.store_dir)
+                    logger.info(f"Reader switched to index generation {generation}")
+                    break
+                except FileNotFoundError as e:
+                    # Pruned between reading CURRENT and opening it; CURRENT has moved on.
+                    logger.warning(f"Index generation {generation} vanished while opening ({e}); retrying.")
+            else:
+                logger.warning("Could not open the live index generation; serving the previous one.")
+        return self._snapshot
+
+    def current(self) -> Snapshot | None:
+        if time.monotonic() - self._checked_at >= self.refresh_seconds:
+            return self.refresh()
+        return self._snapshot
+
+def run_writer():
+    """Single-writer loop: ingest uploads queued by reader processes and publish generations."""
+    import file_utils
+    from database import init_db
+    init_db()
+    before = current_generation()
+    file_utils.load_or_create_faiss_index()
+    if current_generation() == before:
+        file_utils.publish_current()
+    logger.info("Index writer running.")
+    while True:
+        if file_utils.drain_ingest_queue():
+            file_utils.publish_current()
+        time.sleep(WRITER_POLL_SECONDS)
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["writer"]:
+        os.environ["TINA_SERVING_MODE"] = "writer"
+        run_writer()
+    else:
+        print("usage: python index_store.py writer")
@@ -0,0 +1,146 @@
+# lora_backend.py
+"""Local answers from the latest fine-tuned LoRA adapter (tina-lora/run-*).
+
+The base model and adapter load once, lazily, and the adapter is merged into
+the base weights so generation pays no LoRA overhead. Concurrent questions
+are gathered by a DynamicBatcher, which waits at most LORA_BATCH_WAIT_MS
+for company and caps batches at LORA_MAX_BATCH. Each batch runs through a
+single ``generate`` call with the KV cache on, so CPU time is shared across
+requests instead of spent once per question.
+
+Enable with ANSWER_BACKEND=lora (see ask_tina.generate_answer).
+"""
+import os
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from metrics import Histogram, stage
+from training_data import BASE_MODEL, format_prompt, latest_adapter
+
+logger = logging.getLogger(__name__)
+
+LORA_MAX_NEW_TOKENS = int(os.getenv("LORA_MAX_NEW_TOKENS", "200"))
+LORA_MAX_BATCH = int(os.getenv("LORA_MAX_BATCH", "8"))
+LORA_BATCH_WAIT_MS = float(os.getenv("LORA_BATCH_WAIT_MS", "20"))
+LORA_TIMEOUT = float(os.getenv("LORA_TIMEOUT", "120"))
+LORA_THREADS = int(os.getenv("LORA_THREADS", "0"))  # 0: let torch decide
+
+BATCH_SIZES = Histogram(
+    "tina_lora_batch_size", "Questions answered per local generate() call.", buckets=(1, 2, 4, 8, 16, 32)
+)
+
+class DynamicBatcher:
+    """Feed concurrent submissions to ``run_batch`` in groups of up to ``max_batch``.
+
+    The first waiting item opens a batch; others arriving within ``max_wait_ms``
+    join it. ``run_batch`` takes a list of items and returns one result per item.
+    """
+
+    def __init__(self, run_batch, max_batch: int = LORA_MAX_BATCH, max_wait_ms: float = LORA_BATCH_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._loop, name="tina-lora-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item, timeout: float | None = LORA_TIMEOUT):
+        future = Future()
+        self._queue.put((item, future))
+        return future.result(timeout)
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._queue.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            items = [item for item, _ in batch]
+            BATCH_SIZES.observe(len(items))
+            try:
+                results = self.run_batch(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+class LoraGenerator:
+    def __init__(self, adapter_dir: str | None = None):
+        import torch
+        from peft import PeftModel
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        adapter_dir = adapter_dir or latest_adapter()
+        if not adapter_dir:
+            raise RuntimeError("No fine-tuned adapter found under tina-lora/run-*.")
+        if LORA_THREADS:
+            torch.set_num_threads(LORA_THREADS)
+        self.torch = torch
+        self.adapter_dir = adapter_dir
+        self.tokenizer = AutoTokenizer.from_pretrained(adapter_dir)
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Decoder-only models must be left-padded so every prompt ends where generation starts.
+        self.tokenizer.padding_side = "left"
+        base = AutoModelForCausalLM.from_pretrained(BASE_MODEL, torch_dtype=torch.float32)
+        self.model = PeftModel.from_pretrained(base, adapter_dir).merge_and_unload()
+        self.model.eval()
+        logger.info(f"Loaded LoRA adapter from {adapter_dir}")
+
+    def generate_batch(self, questions: list[str]) -> list[str]:
+        prompts = [format_prompt(q) for q in questions]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        with self.torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=LORA_MAX_NEW_TOKENS,
+                do_sample=False,
+                use_cache=True,
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        answers = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        # Training examples are "Q: ...\nA: ..." back to back; stop at the next question.
+        return [a.split("\nQ:")[0].strip() for a in answers]
+
+_generator = None
+_batcher = None
+_load_failed = False
+_lock = threading.Lock()
+
+def get_batcher() -> DynamicBatcher | None:
+    """Load the model once; returns None if it cannot be loaded (and does not try again)."""
+    global _generator, _batcher, _load_failed
+    if _batcher is not None or _load_failed:
+        return _batcher
+    with _lock:
+        if _batcher is None and not _load_failed:
+            try:
+                _generator = LoraGenerator()
+                _batcher = DynamicBatcher(_generator.generate_batch)
+            except Exception as e:
+                logger.warning(f"LoRA model unavailable, answering with ChatGPT: {e}")
+                _load_failed = True
+    return _batcher
+
+def is_available() -> bool:
+    return not _load_failed and latest_adapter() is not None
+
+def warm_up():
+    """Load the model ahead of the first retrieval miss; called from file_utils.warm_up."""
+    if is_available():
+        get_batcher()
+
+def generate(question: str) -> str:
+    batcher = get_batcher()
+    if batcher is None:
+        raise RuntimeError("LoRA model could not be loaded.")
+    with stage("lora"):
+        answer = batcher.submit(question)
+    if not answer:
+        raise RuntimeError("LoRA model returned an empty answer.")
+    return answer
@@ -0,0 +1,71 @@
+# pipeline.py
+"""The answer path behind handle_ask: FAQ lookup, retrieval, generation, learning, logging.
+
+It has no Gradio, Supabase or rate-limit imports, so app._answer and the
+``ask`` benchmark (benchmarks/run.py) run the same code. Callers gate the
+request themselves and pass any per-user quota in as ``admit``.
+"""
+import os
+import logging
+import faq
+from ask_tina import generate_answer
+from database import log_query
+from file_utils import learn_from_text
+from metrics import ANSWERS, stage
+from retrieval import retrieve
+
+# Store per-stage timings (JSON, milliseconds) alongside each logged question.
+LOG_TIMINGS = os.getenv("LOG_TIMINGS", "false").lower() in ("1", "true", "yes")
+
+def score_threshold_fallback(question):
+    try:
+        results, confident = retrieve(question, top_k=3)
+        if not confident:
+            return [], "chatgpt"
+        return results, "faiss"
+    except Exception as e:
+        logging.warning(f"Semantic search failed: {e}")
+        return [], "chatgpt"
+
+def answer_question(question: str, user: str, timings: dict | None = None, admit=None, refund=None) -> tuple[str | None, str | None]:
+    """Answer ``question`` for ``user``; returns (answer, source).
+
+    ``admit()`` is called before any work and returns False to refuse the
+    question, in which case (None, None) comes back. If answering then fails,
+    ``refund()`` gives the admitted slot back and the error propagates.
+    """
+    if admit is not None:
+        with stage("guest_limit"):
+            if not admit():
+                return None, None
+    try:
+        return _answer(question, user, timings)
+    except Exception:
+        if refund is not None:
+            refund()
+        raise
+
+def _answer(question: str, user: str, timings: dict | None) -> tuple[str, str]:
+    with stage("faq"):
+        entry = faq.lookup(question)
+    if entry:
+        results, source = [faq.render(entry)], "faq"
+    else:
+        with stage("retrieval"):
+            results, source = score_threshold_fallback(question)
+
+    if source == "chatgpt":
+        generated, source = generate_answer(question)
+        results = [generated]
+
+    answer = "\n\n---\n\n".join(dict.fromkeys(results))
+
+    # Local LoRA answers are distilled from our own logs, so only API answers are learned.
+    if source == "chatgpt":
+        with stage("learn"):
+            learn_from_text(answer)
+
+    ANSWERS.inc(source)
+    with stage("log"):
+        log_query(user, question, source, answer, timings=timings if LOG_TIMINGS else None)
+    return answer, source
@@ -0,0 +1,170 @@
+# rate_limit.py
+"""Sliding-window rate limiting with pluggable backends.
+
+``MemoryBackend`` is per-process and bounded (least recently used keys are
+evicted). ``SQLiteBackend`` keeps the window in a SQLite table so every
+worker process sharing the database file shares the same limits and they
+survive restarts. Pick the default with RATE_LIMIT_BACKEND=memory|sqlite.
+
+Behind a reverse proxy every guest arrives from the proxy's address; list it
+in TRUSTED_PROXIES (comma-separated, or ``*``) so ``client_ip`` keys guests
+on the first X-Forwarded-For hop instead.
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+import database
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
+TRUSTED_PROXIES = {p.strip() for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()}
+
+def client_ip(peer: str | None, forwarded_for: str | None, trusted: set = TRUSTED_PROXIES) -> str:
+    """Address to rate-limit: the first X-Forwarded-For hop if ``peer`` is a trusted proxy."""
+    if peer and forwarded_for and ("*" in trusted or peer in trusted):
+        first = forwarded_for.split(",")[0].strip()
+        if first:
+            return first
+    return peer or "anonymous"
+
+class MemoryBackend:
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, window: float, now: float) -> tuple[bool, int]:
+        with self._lock:
+            events = self._events.get(key)
+            if events is None:
+                events = self._events[key] = deque()
+                while len(self._events) > self.max_keys:
+                    self._events.popitem(last=False)
+            else:
+                self._events.move_to_end(key)
+            while events and events[0] <= now - window:
+                events.popleft()
+            if len(events) >= limit:
+                return False, 0
+            events.append(now)
+            return True, limit - len(events)
+
+    def refund(self, key: str):
+        with self._lock:
+            events = self._events.get(key)
+            if events:
+                events.pop()
+
+    def count(self, key: str, window: float, now: float) -> int:
+        with self._lock:
+            events = self._events.get(key, ())
+            return sum(1 for ts in events if ts > now - window)
+
+    def reset(self, key: str):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def purge(self, prefix: str, older_than: float):
+        with self._lock:
+            for key in [k for k, ev in self._events.items() if k.startswith(prefix) and (not ev or ev[-1] <= older_than)]:
+                del self._events[key]
+
+class SQLiteBackend:
+    def __init__(self, db_path: str | None = None):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        # One long-lived connection per thread: opening and closing a WAL database
+        # on every check costs far more than the check itself.
+        path = self.db_path or database.DB_PATH
+        if not hasattr(self._local, "conns"):
+            self._local.conns = {}
+        conns = self._local.conns
+        conn = conns.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Limiter state is cheap to lose on power failure; skip the fsync per commit.
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_events (key TEXT, ts REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limit_events ON rate_limit_events(key, ts)")
+            conns[path] = conn
+        return conn
+
+    def hit(self, key: str, limit: int, window: float, now: float) -> tuple[bool, int]:
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front so concurrent workers serialize here.
+        # If it fails (e.g. "database is locked") no transaction was opened, so let it raise.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM rate_limit_events WHERE key = ? AND ts <= ?", (key, now - window))
+            used = conn.execute("SELECT COUNT(*) FROM rate_limit_events WHERE key = ?", (key,)).fetchone()[0]
+            if used >= limit:
+                conn.execute("COMMIT")
+                return False, 0
+            conn.execute("INSERT INTO rate_limit_events(key, ts) VALUES (?, ?)", (key, now))
+            conn.execute("COMMIT")
+            return True, limit - used - 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def refund(self, key: str):
+        self._conn().execute(
+            "DELETE FROM rate_limit_events WHERE rowid = "
+            "(SELECT rowid FROM rate_limit_events WHERE key = ? ORDER BY ts DESC LIMIT 1)",
+            (key,)
+        )
+
+    def count(self, key: str, window: float, now: float) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM rate_limit_events WHERE key = ? AND ts > ?", (key, now - window)
+        ).fetchone()[0]
+
+    def reset(self, key: str):
+        self._conn().execute("DELETE FROM rate_limit_events WHERE key = ?", (key,))
+
+    def purge(self, prefix: str, older_than: float):
+        self._conn().execute(
+            "DELETE FROM rate_limit_events WHERE key >= ? AND key < ? AND ts <= ?",
+            (prefix, prefix + "\uffff", older_than)
+        )
+
+def default_backend():
+    return MemoryBackend() if RATE_LIMIT_BACKEND == "memory" else SQLiteBackend()
+
+class RateLimiter:
+    """Allow at most ``limit`` hits per ``window`` seconds for each key."""
+
+    PURGE_EVERY = 1000
+
+    def __init__(self, name: str, limit: int, window: float, backend=None):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.backend = backend or default_backend()
+        self._hits = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.name}:{key}"
+
+    def hit(self, key: str) -> tuple[bool, int]:
+        """Record a hit if allowed; returns (allowed, remaining hits in the window)."""
+        now = time.time()
+        self._hits += 1
+        if self._hits % self.PURGE_EVERY == 0:
+            # Keys that stopped calling would otherwise keep their expired events forever.
+            self.backend.purge(f"{self.name}:", now - self.window)
+        return self.backend.hit(self._key(key), self.limit, self.window, now)
+
+    def refund(self, key: str):
+        """Give back the most recent hit, e.g. when the request it paid for failed."""
+        self.backend.refund(self._key(key))
+
+    def remaining(self, key: str) -> int:
+        return max(self.limit - self.backend.count(self._key(key), self.window, time.time()), 0)
+
+    def reset(self, key: str):
+        self.backend.reset(self._key(key))
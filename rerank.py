@@ -0,0 +1,66 @@
+# rerank.py
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL_PATH = os.getenv("RERANK_MODEL_PATH", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+
+_cross_encoder = None
+_load_failed = False
+_lock = threading.Lock()
+
+def get_cross_encoder():
+    """Load the cross-encoder once; returns None if it cannot be loaded."""
+    global _cross_encoder, _load_failed
+    if _cross_encoder is not None or _load_failed:
+        return _cross_encoder
+    with _lock:
+        if _cross_encoder is None and not _load_failed:
+            try:
+                from sentence_transformers import CrossEncoder
+                _cross_encoder = CrossEncoder(RERANK_MODEL_PATH, device="cpu")
+            except Exception as e:
+                logger.warning(f"Cross-encoder unavailable, keeping dense order: {e}")
+                _load_failed = True
+    return _cross_encoder
+
+def rerank(query: str, candidates: list[str], top_k: int = 3, budget_ms: float = RERANK_BUDGET_MS,
+           batch_size: int = RERANK_BATCH_SIZE) -> list[int]:
+    """Return candidate positions re-ordered by cross-encoder score.
+
+    ``candidates`` must arrive best-first from the first-stage retriever. They are
+    scored in batches until the latency budget would be exceeded; the scored
+    prefix is re-ordered and anything left unscored keeps its original order
+    behind it, so a tight budget degrades to the first-stage ranking.
+    """
+    order = list(range(len(candidates)))
+    encoder = get_cross_encoder()
+    if encoder is None or len(candidates) < 2:
+        return order[:top_k]
+
+    deadline = time.perf_counter() + budget_ms / 1000
+    scores = []
+    batch_seconds = 0.0
+    for start in range(0, len(candidates), batch_size):
+        now = time.perf_counter()
+        if scores and now + batch_seconds > deadline:
+            logger.info(f"Rerank budget reached after {len(scores)}/{len(candidates)} candidates")
+            break
+        batch = candidates[start:start + batch_size]
+        try:
+            batch_scores = encoder.predict([(query, text) for text in batch], batch_size=batch_size)
+        except Exception as e:
+            logger.warning(f"Cross-encoder scoring failed, keeping dense order: {e}")
+            return order[:top_k]
+        scores.extend(float(s) for s in batch_scores)
+        batch_seconds = time.perf_counter() - now
+
+    scored = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+    return (scored + order[len(scores):])[:top_k]
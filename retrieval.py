@@ -0,0 +1,128 @@
+# retrieval.py
+import os
+import re
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import file_utils
+from database import search_passages
+from rerank import RERANK_ENABLED, RERANK_CANDIDATES, rerank
+from metrics import stage
+
+# L2 distance above which the best dense hit is considered off-topic.
+FAISS_THRESHOLD = float(os.getenv("FAISS_THRESHOLD", "0.45"))
+
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+CANDIDATE_DEPTH = int(os.getenv("HYBRID_CANDIDATE_DEPTH", "20"))
+# Results whose embeddings are closer than this (squared L2) to a better-ranked
+# result are treated as rewordings of it and dropped.
+RESULT_DUP_DISTANCE = float(os.getenv("RESULT_DUP_DISTANCE", "0.05"))
+
+# Statutory references and BIR issuance/form codes, e.g. "Sec. 34(L)", "RR 8-2018",
+# "RMC No. 5-2020", "BIR Form 1701".
+CITATION_PATTERN = re.compile(
+    r"\b(?:sec(?:tion)?\.?\s*\d+[A-Za-z]?(?:\s*\([A-Za-z0-9]+\))*"
+    r"|(?:RR|RMC|RMO|RAMO|RA|BIR\s+Form|Form)\s*(?:No\.?\s*)?\d+[A-Za-z]?(?:-\d+)*)",
+    re.IGNORECASE
+)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hybrid")
+
+def extract_citations(text: str) -> list[str]:
+    return [m.group(0) for m in CITATION_PATTERN.finditer(text)]
+
+def dense_search(query: str, depth: int = CANDIDATE_DEPTH) -> list[tuple[int, float]]:
+    """FAISS search; returns (passage_id, l2_distance), nearest first."""
+    index, passages = file_utils.snapshot()
+    if index is None or index.ntotal == 0:
+        return []
+    query_vec = file_utils.encode_query(query)
+    with stage("faiss_search"):
+        distances, indices = index.search(query_vec, depth)
+    return [(int(i), float(d)) for i, d in zip(indices[0], distances[0]) if 0 <= i < len(passages)]
+
+def citation_search(query: str, depth: int = CANDIDATE_DEPTH) -> list[tuple[int, float]]:
+    """Exact phrase matches for every citation found in the query."""
+    results = []
+    for citation in extract_citations(query):
+        results.extend(search_passages(citation, limit=depth, phrase=True))
+    return results
+
+def lexical_search(query: str, depth: int = CANDIDATE_DEPTH) -> tuple[list[tuple[int, float]], bool]:
+    """BM25 search with verbatim citation hits ranked first.
+
+    Returns (passage_id, score) pairs and whether any citation matched.
+    """
+    with stage("bm25_search"):
+        citation_hits = citation_search(query, depth)
+        seen = {}
+        for pid, score in citation_hits + search_passages(query, limit=depth):
+            seen.setdefault(pid, score)
+    return list(seen.items())[:depth], bool(citation_hits)
+
+def reciprocal_rank_fusion(rankings: list[list[int]], weights: list[float], k: int = RRF_K) -> list[tuple[int, float]]:
+    """Weighted RRF: score(d) = sum_i w_i / (k + rank_i(d)), ranks starting at 1."""
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        if not weight:
+            continue
+        for rank, pid in enumerate(ranking, start=1):
+            scores[pid] = scores.get(pid, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def hybrid_search(query: str, top_k: int = 3, dense_weight: float | None = None,
+                  lexical_weight: float | None = None, depth: int = CANDIDATE_DEPTH) -> tuple[list[int], bool]:
+    """Run dense and lexical retrieval in parallel and fuse them with RRF.
+
+    Returns the fused passage ids and whether retrieval is confident enough to
+    answer without the LLM: either the nearest vector is within FAISS_THRESHOLD
+    or a citation in the question matched a passage verbatim.
+    """
+    dense_weight = HYBRID_DENSE_WEIGHT if dense_weight is None else dense_weight
+    lexical_weight = HYBRID_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+
+    # Run each search in a copy of the caller's context so stage timings reach its request.
+    dense_future = _executor.submit(contextvars.copy_context().run, dense_search, query, depth) if dense_weight else None
+    lexical_future = _executor.submit(contextvars.copy_context().run, lexical_search, query, depth) if lexical_weight else None
+    dense = dense_future.result() if dense_future else []
+    lexical, citation_matched = lexical_future.result() if lexical_future else ([], False)
+
+    fused = reciprocal_rank_fusion(
+        [[pid for pid, _ in dense], [pid for pid, _ in lexical]],
+        [dense_weight, lexical_weight]
+    )
+    dense_confident = bool(dense) and dense[0][1] <= FAISS_THRESHOLD
+    return [pid for pid, _ in fused[:top_k]], dense_confident or citation_matched
+
+def drop_near_duplicates(ids: list[int], min_distance: float = RESULT_DUP_DISTANCE) -> list[int]:
+    """Keep ids in order, skipping any whose stored vector nearly coincides with a kept one."""
+    index, _ = file_utils.snapshot()
+    if index is None:
+        return ids
+    ids = [i for i in ids if i < index.ntotal]
+    if len(ids) < 2:
+        return ids
+    vectors = np.vstack([index.reconstruct(int(i)) for i in ids])
+    kept = []
+    for pos in range(len(ids)):
+        if all(float(np.sum((vectors[pos] - vectors[k]) ** 2)) >= min_distance for k in kept):
+            kept.append(pos)
+    return [ids[pos] for pos in kept]
+
+def retrieve(query: str, top_k: int = 3) -> tuple[list[str], bool]:
+    if not RERANK_ENABLED:
+        ids, confident = hybrid_search(query, top_k=top_k * 3)
+        ids = drop_near_duplicates(ids)[:top_k]
+        _, passages = file_utils.snapshot()
+        # Lexical ids come from SQLite, which may briefly run ahead of a reader's generation.
+        return [passages[i] for i in ids if i < len(passages)], confident
+    depth = max(CANDIDATE_DEPTH, RERANK_CANDIDATES)
+    ids, confident = hybrid_search(query, top_k=RERANK_CANDIDATES, depth=depth)
+    ids = drop_near_duplicates(ids)
+    _, passages = file_utils.snapshot()
+    candidates = [passages[i] for i in ids if i < len(passages)]
+    with stage("rerank"):
+        order = rerank(query, candidates, top_k=top_k)
+    return [candidates[i] for i in order], confident
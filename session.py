@@ -0,0 +1,118 @@
+# session.py
+"""Signed local session tokens and a short-lived profile cache.
+
+After a successful Supabase sign-in we issue our own HMAC-signed token, so
+checking who is calling is a local signature check instead of a network
+round trip. Role and subscription can change during a session, so callers
+read them from the profile cache rather than the token's claims. Profiles
+fetched from Supabase are kept for PROFILE_CACHE_TTL seconds and invalidated
+explicitly when they change.
+
+Every worker must share SESSION_SECRET, or a token issued by one is refused
+by the next.
+"""
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+import secrets
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL = int(os.getenv("SESSION_TTL", "1800"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "60"))
+
+_secret = os.getenv("SESSION_SECRET")
+SESSION_SECRET = (_secret or secrets.token_hex(32)).encode("utf-8")
+
+def check_session_secret():
+    """Refuse to issue sessions with a per-process secret."""
+    if not _secret:
+        raise RuntimeError("❌ SESSION_SECRET is missing. Set it in environment variables or .env")
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def _sign(payload: str, secret: bytes) -> str:
+    return _b64encode(hmac.new(secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+def issue_session_token(profile: dict, ttl: int = SESSION_TTL, secret: bytes = SESSION_SECRET) -> str:
+    claims = {
+        "sub": profile.get("id"),
+        "email": profile.get("email"),
+        "role": profile.get("role", "user"),
+        "subscription_level": profile.get("subscription_level"),
+        "exp": int(time.time()) + ttl
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload, secret)}"
+
+def verify_session_token(token: str, secret: bytes = SESSION_SECRET) -> dict | None:
+    """Return the token's claims if the signature is valid and it has not expired."""
+    if not token or token.count(".") != 1:
+        return None
+    payload, signature = token.split(".")
+    if not hmac.compare_digest(signature, _sign(payload, secret)):
+        return None
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire ``ttl`` seconds after they are set."""
+
+    def __init__(self, ttl: float = PROFILE_CACHE_TTL, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self.invalidate(key)
+            return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                now = time.monotonic()
+                for k in [k for k, (exp, _) in self._data.items() if exp < now]:
+                    del self._data[k]
+                if len(self._data) >= self.max_entries:
+                    self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_fetch(self, key, fetch):
+        value = self.get(key)
+        if value is None:
+            value = fetch(key)
+            if value is not None:
+                self.set(key, value)
+        return value
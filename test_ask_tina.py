@@ -0,0 +1,113 @@
+# test_ask_tina.py
+import sys
+import time
+import types
+import threading
+import pytest
+import ask_tina
+from ask_tina import ask_chatgpt, fallback_to_chatgpt, generate_answer, normalize_question
+
+class RateLimitError(Exception):
+    pass
+
+class InvalidRequestError(Exception):
+    pass
+
+def fake_openai(create):
+    module = types.ModuleType("openai")
+    module.error = types.SimpleNamespace(RateLimitError=RateLimitError)
+    module.ChatCompletion = types.SimpleNamespace(create=create)
+    return module
+
+def reply(content):
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+        usage={"prompt_tokens": 5, "completion_tokens": 7}
+    )
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(ask_tina, "_answer_cache", ask_tina.TTLCache(ttl=60))
+    monkeypatch.setattr(ask_tina, "_in_flight", ask_tina.SingleFlight())
+    monkeypatch.setattr(ask_tina.time, "sleep", lambda s: None)
+
+def test_normalize_question_ignores_case_punctuation_and_filler():
+    assert normalize_question("What is the VAT rate?") == normalize_question("what is VAT rate po")
+
+def test_concurrent_identical_questions_share_one_request(monkeypatch):
+    calls = []
+    def create(model, messages):
+        calls.append(messages[0]["content"])
+        threading.Event().wait(0.2)
+        return reply("12%")
+    monkeypatch.setitem(sys.modules, "openai", fake_openai(create))
+
+    answers = []
+    threads = [
+        threading.Thread(target=lambda q=q: answers.append(ask_chatgpt(q)))
+        for q in ["What is the VAT rate?", "what is the VAT rate", "What is the VAT rate, please?"] * 3
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert answers == ["12%"] * 9
+
+def test_rate_limits_are_retried_with_backoff(monkeypatch):
+    attempts = []
+    def create(model, messages):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError("slow down")
+        return reply("April 15")
+    monkeypatch.setitem(sys.modules, "openai", fake_openai(create))
+    assert ask_chatgpt("When is the ITR deadline?") == "April 15"
+    assert len(attempts) == 3
+
+def test_backoff_releases_the_concurrency_slot(monkeypatch):
+    monkeypatch.setattr(ask_tina, "_openai_slots", threading.BoundedSemaphore(1))
+    backing_off, other_done = threading.Event(), threading.Event()
+    def sleep(seconds):
+        backing_off.set()
+        assert other_done.wait(5), "the other caller never got the slot"
+    monkeypatch.setattr(ask_tina.time, "sleep", sleep)
+    attempts = []
+    def create(model, messages):
+        question = messages[0]["content"]
+        attempts.append(question)
+        if question == "When is the ITR deadline?" and attempts.count(question) == 1:
+            raise RateLimitError("slow down")
+        return reply("ok")
+    monkeypatch.setitem(sys.modules, "openai", fake_openai(create))
+
+    retrying = threading.Thread(target=lambda: ask_chatgpt("When is the ITR deadline?"))
+    retrying.start()
+    assert backing_off.wait(5)
+    assert ask_chatgpt("What is the VAT rate?") == "ok"
+    other_done.set()
+    retrying.join(5)
+    assert attempts == ["When is the ITR deadline?", "What is the VAT rate?", "When is the ITR deadline?"]
+
+def test_non_retryable_errors_fail_fast(monkeypatch):
+    attempts = []
+    def create(model, messages):
+        attempts.append(1)
+        raise InvalidRequestError("bad request")
+    monkeypatch.setitem(sys.modules, "openai", fake_openai(create))
+    assert fallback_to_chatgpt("What is DST?").startswith("[ChatGPT Error]")
+    assert len(attempts) == 1
+
+def test_lora_backend_answers_locally(monkeypatch):
+    import lora_backend
+    monkeypatch.setattr(ask_tina, "ANSWER_BACKEND", "lora")
+    monkeypatch.setattr(lora_backend, "is_available", lambda: True)
+    monkeypatch.setattr(lora_backend, "generate", lambda q: "Due on April 15.")
+    monkeypatch.setitem(sys.modules, "openai", fake_openai(lambda **kw: pytest.fail("API should not be called")))
+    assert generate_answer("When is the ITR deadline?") == ("Due on April 15.", "lora")
+
+def test_lora_backend_without_adapter_falls_back_to_chatgpt(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ask_tina, "ANSWER_BACKEND", "lora")
+    monkeypatch.setitem(sys.modules, "openai", fake_openai(lambda model, messages: reply("12%")))
+    assert generate_answer("What is the VAT rate?") == ("12%", "chatgpt")
@@ -3,8 +3,15 @@ import os
 import pytest
 from database import (
     init_db, get_conn, log_query, view_logs, view_summaries,
-    store_file_text, export_logs_csv, delete_log_by_id
+    store_file_text, export_logs_csv, delete_log_by_id,
+    add_passage, clear_passages, load_passages, search_passages, search_logs
 )
+import database
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "fts.db"))
+    init_db()
 
 def test_log_query():
     log_query("test", "What is VAT?", "semantic", "Value Added Tax")
@@ -32,4 +39,53 @@ def test_delete_log_by_id():
         rowid = c.lastrowid
         conn.commit()
     msg = delete_log_by_id(rowid)
-    assert f"Log ID {rowid} deleted." in msg
\ No newline at end of file
+    assert f"Log ID {rowid} deleted." in msg
+
+def test_search_passages_ranks_exact_citation(fresh_db):
+    add_passage(0, "Income tax rates for individuals under the TRAIN law.")
+    add_passage(1, "Sec. 34(L) allows the optional standard deduction of 40% of gross sales.")
+    add_passage(2, "RR 8-2018 implements the income tax provisions of TRAIN.")
+    assert [pid for pid, _ in search_passages("What does Sec. 34(L) say?")][0] == 1
+    assert [pid for pid, _ in search_passages("RR 8-2018")][0] == 2
+    assert search_passages("   ") == []
+
+def test_passages_stay_in_sync(fresh_db):
+    add_passage(0, "old text about percentage tax")
+    add_passage(0, "new text about donor's tax")
+    assert load_passages() == ["new text about donor's tax"]
+    assert search_passages("percentage") == []
+    clear_passages()
+    assert search_passages("donor") == []
+
+def test_search_logs_follows_inserts_and_deletes(fresh_db):
+    log_query("test", "When is BIR Form 1701 due?", "semantic", "April 15")
+    log_query("test", "What is VAT?", "semantic", "Value Added Tax")
+    rows = search_logs("1701")
+    assert len(rows) == 1 and rows[0][2] == "When is BIR Form 1701 due?"
+    delete_log_by_id(rows[0][0])
+    assert search_logs("1701") == []
+
+def test_log_query_stores_timings(fresh_db):
+    log_query("test", "What is DST?", "faiss", "Documentary stamp tax", timings={"retrieval": 12.5})
+    log_query("test", "What is CGT?", "faiss", "Capital gains tax")
+    with get_conn() as conn:
+        rows = conn.execute("SELECT timings FROM logs ORDER BY rowid").fetchall()
+    assert rows == [('{"retrieval": 12.5}',), (None,)]
+
+def test_existing_logs_get_stable_ids(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "old.db"))
+    with get_conn() as conn:
+        conn.execute("CREATE TABLE logs (username TEXT, query TEXT, context TEXT, response TEXT, timestamp TEXT)")
+        conn.executemany("INSERT INTO logs(username, query, context, response) VALUES (?,?,?,?)", [
+            ("a", "What is VAT?", "faiss", "Value Added Tax"),
+            ("b", "Who files BIR Form 1701?", "faiss", "Self-employed individuals"),
+            ("c", "What is DST?", "faiss", "Documentary stamp tax"),
+        ])
+        conn.execute("DELETE FROM logs WHERE username = 'a'")
+    init_db()
+    with get_conn() as conn:
+        assert conn.execute("SELECT id, username FROM logs ORDER BY id").fetchall() == [(2, "b"), (3, "c")]
+        conn.execute("VACUUM")
+    log_query("d", "When is BIR Form 2550Q due?", "faiss", "Quarterly")
+    assert [row[0] for row in search_logs("1701")] == [2]
+    assert [row[0] for row in search_logs("2550Q")] == [4]
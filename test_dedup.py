@@ -0,0 +1,77 @@
+# test_dedup.py
+import os
+import numpy as np
+import pytest
+import database
+import file_utils
+from database import init_db
+from dedup import compact_dynamic_knowledge, minhash, estimate_similarity, find_near_duplicate, register_document, content_hash
+
+ANSWER = (
+    "The deadline for filing the annual income tax return (BIR Form 1701) for individuals "
+    "is on or before April 15 of each year, covering income earned in the preceding calendar year."
+)
+REWORDED = (
+    "The deadline for filing the annual income tax return (BIR Form 1701) for individuals "
+    "is on or before April 15 every year, covering income earned in the preceding calendar year."
+)
+# Close enough to ANSWER to pass the default NEAR_DUP_THRESHOLD.
+CLOSE = ANSWER.replace("covering income", "for income")
+UNRELATED = "Value added tax is imposed at twelve percent on the sale of goods and services in the Philippines."
+
+class FakeEncoder:
+    def encode(self, texts, convert_to_tensor=False):
+        return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in texts], dtype=np.float32)
+
+@pytest.fixture(autouse=True)
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "dedup.db"))
+    init_db()
+
+@pytest.fixture
+def knowledge(tmp_path, monkeypatch):
+    pytest.importorskip("faiss")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(file_utils, "model", FakeEncoder())
+    monkeypatch.setattr(file_utils, "index", None)
+    monkeypatch.setattr(file_utils, "knowledge_texts", [])
+    os.makedirs(file_utils.DYNAMIC_DIR)
+    return tmp_path
+
+def test_minhash_similarity_tracks_overlap():
+    assert estimate_similarity(minhash(ANSWER), minhash(ANSWER)) == 1.0
+    assert estimate_similarity(minhash(ANSWER), minhash(REWORDED)) > 0.6
+    assert estimate_similarity(minhash(ANSWER), minhash(UNRELATED)) < 0.2
+
+def test_find_near_duplicate_after_register():
+    assert find_near_duplicate(ANSWER) is None
+    register_document(ANSWER)
+    assert find_near_duplicate(ANSWER) == content_hash(ANSWER)
+    assert find_near_duplicate(REWORDED, threshold=0.6) == content_hash(ANSWER)
+    assert find_near_duplicate(UNRELATED) is None
+
+def test_ingest_skips_near_duplicate_upload_and_rebuild_keeps_it_out(knowledge):
+    assert file_utils.ingest_document(ANSWER, source="faq.txt")[1]
+    upload = knowledge / "reworded.txt"
+    upload.write_text(CLOSE)
+    path, digest, _ = file_utils.save_file(str(upload))
+    assert file_utils.ingest_upload(path, digest, "reworded.txt") == (content_hash(ANSWER), False)
+    assert file_utils.index.ntotal == 1
+
+    file_utils.rebuild_index()
+    assert file_utils.knowledge_texts == [ANSWER]
+
+def test_compaction_drops_duplicates_from_static_and_dynamic_files(knowledge):
+    (knowledge / "knowledge_files" / "a.txt").write_text(ANSWER)
+    (knowledge / "knowledge_files" / "b.txt").write_text(CLOSE)
+    (knowledge / "knowledge_files" / "dynamic" / "dynamic_1.txt").write_text(CLOSE + " Penalties apply.")
+    (knowledge / "knowledge_files" / "dynamic" / "dynamic_2.txt").write_text(UNRELATED)
+    file_utils.rebuild_index()
+    assert file_utils.index.ntotal == 4
+
+    assert compact_dynamic_knowledge() == (2, 2)
+    assert sorted(os.listdir(knowledge / "knowledge_files" / "dynamic")) == ["dynamic_2.txt"]
+    # The static duplicate stays on disk but is not indexed again.
+    assert (knowledge / "knowledge_files" / "b.txt").exists()
+    file_utils.rebuild_index()
+    assert sorted(file_utils.knowledge_texts) == sorted([ANSWER, UNRELATED])
@@ -0,0 +1,100 @@
+# test_faq.py
+import zlib
+import numpy as np
+import pytest
+import database
+import faq
+import file_utils
+from database import init_db, log_query
+
+class BagOfWordsEncoder:
+    """Questions sharing most of their words get nearby vectors."""
+
+    def encode(self, texts, convert_to_tensor=False):
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().replace("?", "").replace(",", "").split():
+                vectors[row, zlib.crc32(word.encode()) % 64] += 1.0
+        return vectors
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "faq.db"))
+    monkeypatch.setattr(file_utils, "model", BagOfWordsEncoder())
+    monkeypatch.setattr(faq, "_index", faq.FaqIndex())
+    file_utils._query_embeddings.clear()
+    init_db()
+
+def ask(times, question, answer, context="faiss"):
+    for _ in range(times):
+        log_query("user@example.com", question, context, answer)
+
+def test_frequent_questions_become_entries():
+    ask(4, "What is the VAT rate?", "VAT is 12% under Sec. 106(A).")
+    ask(2, "what is the VAT rate po", "VAT is 12% under Sec. 106(A).")
+    ask(1, "What is the VAT rate in the Philippines?", "Twelve percent.")
+    ask(2, "When is BIR Form 1701 due?", "April 15.")
+
+    assert faq.build_faq_index(min_count=5) == 1
+    entry = faq.lookup("What is the VAT rate?")
+    assert entry["question"] == "What is the VAT rate?"
+    assert entry["answer"] == "VAT is 12% under Sec. 106(A)."
+    assert entry["citations"] == ["Sec. 106(A)"]
+    assert entry["hits"] == 6
+    assert faq.lookup("When is BIR Form 1701 due?") is None
+
+def test_known_phrasing_skips_embedding(monkeypatch):
+    ask(5, "What is the VAT rate?", "VAT is 12%.")
+    faq.build_faq_index(min_count=5)
+    monkeypatch.setattr(file_utils, "encode_query", lambda q: pytest.fail("exact alias should not embed"))
+    assert faq.lookup("WHAT is the vat rate??")["answer"] == "VAT is 12%."
+
+def test_new_paraphrase_matches_by_embedding():
+    ask(5, "What is the current VAT rate for sellers?", "VAT is 12%.")
+    faq.build_faq_index(min_count=5)
+    assert faq.lookup("For sellers, what is the current VAT rate?")["answer"] == "VAT is 12%."
+    assert faq.lookup("Who must file estate tax returns?") is None
+
+def test_rebuild_replaces_entries():
+    ask(5, "What is the VAT rate?", "VAT is 12%.")
+    faq.build_faq_index(min_count=5)
+    assert faq.build_faq_index(min_count=50) == 0
+    assert faq.lookup("What is the VAT rate?") is None
+
+def test_generated_answers_are_not_served():
+    ask(5, "What is the VAT rate?", "VAT is 12%.", context="chatgpt")
+    ask(5, "What is the estate tax rate?", "Estate tax is 6%.", context="lora")
+    assert faq.build_faq_index(min_count=5) == 0
+
+def test_different_form_number_or_year_does_not_match():
+    ask(5, "When is BIR Form 1702 due?", "On or before April 15 for calendar-year corporations.")
+    ask(5, "What is the VAT threshold for 2024?", "PHP 3,000,000.")
+    faq.build_faq_index(min_count=5)
+    assert faq.lookup("When is BIR Form 1702 due?") is not None
+    assert faq.lookup("When is BIR Form 1701 due?") is None
+    assert faq.lookup("What is the VAT threshold for 2018?") is None
+    assert faq.lookup("For 2024, what is the VAT threshold?")["answer"] == "PHP 3,000,000."
+
+def test_answer_is_rendered_with_its_citations():
+    ask(5, "What is the VAT rate?", "VAT is 12% under Sec. 106(A).")
+    faq.build_faq_index(min_count=5)
+    assert faq.render(faq.lookup("What is the VAT rate?")) == "VAT is 12% under Sec. 106(A).\n\n📚 Sources: Sec. 106(A)"
+
+def test_refresh_waits_for_a_fresh_index(monkeypatch):
+    ask(5, "What is the VAT rate?", "VAT is 12%.")
+    faq.build_faq_index(min_count=5)
+    monkeypatch.setattr(faq, "build_faq_index", lambda: pytest.fail("index is fresh"))
+    assert faq.refresh_if_due(hours=24) > 23 * 3600
+
+def test_refresh_rebuilds_once_the_last_build_is_old(monkeypatch):
+    ask(5, "What is the VAT rate?", "VAT is 12%.")
+    faq.build_faq_index(min_count=5)
+    with database.get_conn() as conn:
+        conn.execute("UPDATE faq_builds SET built_at = 0")
+    builds = []
+    build = faq.build_faq_index
+    monkeypatch.setattr(faq, "build_faq_index", lambda: builds.append(1) or build(min_count=5))
+    monkeypatch.setattr(file_utils, "wait_until_ready", lambda timeout: True)
+    assert faq.refresh_if_due(hours=24) == 24 * 3600
+    assert builds == [1]
+    assert faq.refresh_if_due(hours=24) > 23 * 3600
@@ -1,4 +1,6 @@
+import io
 import os
+import hashlib
 import tempfile
 import pytest
 from PIL import Image, ImageDraw, ImageFont
@@ -100,13 +102,24 @@ def test_is_valid_file_rejects_disallowed():
         file.close()
         os.remove(file.name)
 
-def test_save_file_valid(tmp_path):
-    file_path = tmp_path / "sample.txt"
-    file_path.write_bytes(b"content")
-    with open(file_path, "rb") as f:
-        f.name = file_path.name
-        path, err = save_file(f)
-    assert os.path.exists(path)
+def test_save_file_valid(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    upload = io.BytesIO(b"content")
+    upload.name = "sample.txt"
+    path, digest, err = save_file(upload)
     assert err == ""
-    os.remove(path)
-    os.rmdir(os.path.dirname(path))
+    assert digest == hashlib.sha256(b"content").hexdigest()
+    assert os.path.basename(path) == f"{digest}.txt"
+    with open(path, "rb") as f:
+        assert f.read() == b"content"
+
+def test_save_file_stores_identical_content_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = io.BytesIO(b"same bytes")
+    first.name = "a.txt"
+    second = io.BytesIO(b"same bytes")
+    second.name = "b.txt"
+    assert save_file(first)[0] == save_file(second)[0]
+    assert [n for n in os.listdir(os.path.dirname(save_file(first)[0])) if not n.startswith(".")] == [
+        f"{hashlib.sha256(b'same bytes').hexdigest()}.txt"
+    ]
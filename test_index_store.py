@@ -0,0 +1,147 @@
+# test_index_store.py
+import os
+import numpy as np
+import pytest
+import database
+import file_utils
+import index_store
+from database import failed_ingests, init_db, pending_ingests
+from index_store import PassageStore, SharedIndexReader, current_generation, open_generation, publish_generation
+from vector_store import MappedFlatIndex
+
+class ArrayFlatIndex:
+    """The slice of faiss.IndexFlat that publish_generation reads."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.d, self.ntotal = vectors.shape[1], len(vectors)
+
+    def reconstruct_n(self, start, n):
+        return self.vectors[start:start + n]
+
+def test_passage_store_round_trip(tmp_path):
+    texts = ["Sec. 24(A) income tax", "", "Buwis sa kita — ₱250,000 exemption"]
+    generation = publish_generation(None, texts, store_dir=str(tmp_path))
+    store = PassageStore(str(tmp_path / f"gen-{generation:08d}"))
+    assert len(store) == 3
+    assert list(store) == texts
+    assert store[-1] == texts[-1]
+    with pytest.raises(IndexError):
+        store[3]
+
+def test_reader_swaps_to_new_generation(tmp_path):
+    store_dir = str(tmp_path)
+    reader = SharedIndexReader(store_dir, refresh_seconds=0)
+    assert reader.current() is None
+
+    publish_generation(None, ["VAT is 12%."], store_dir=store_dir)
+    first = reader.current()
+    assert first.generation == 1 and list(first.passages) == ["VAT is 12%."]
+
+    publish_generation(None, ["VAT is 12%.", "Percentage tax is 3%."], store_dir=store_dir)
+    second = reader.current()
+    assert second.generation == 2 and len(second.passages) == 2
+    # The old snapshot stays usable for requests that already hold it.
+    assert list(first.passages) == ["VAT is 12%."]
+
+def test_old_generations_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr("index_store.INDEX_STORE_KEEP", 2)
+    for i in range(4):
+        publish_generation(None, [f"passage {i}"], store_dir=str(tmp_path))
+    assert current_generation(str(tmp_path)) == 4
+    assert sorted(n for n in os.listdir(tmp_path) if n.startswith("gen-")) == ["gen-00000003", "gen-00000004"]
+
+def test_reader_mode_queues_uploads_for_the_writer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "reader.db"))
+    monkeypatch.setattr(file_utils, "SERVING_MODE", "reader")
+    init_db()
+
+    doc_hash, is_new = file_utils.ingest_document("Estate tax is 6% of the net estate.", source="estate.txt")
+    assert is_new
+    assert [row[1:] for row in pending_ingests()] == [("Estate tax is 6% of the net estate.", "estate.txt", "dynamic", None, None)]
+    assert file_utils.index is None
+    assert not os.path.exists(file_utils.DYNAMIC_DIR)
+
+def test_published_flat_index_is_searched_from_the_mapped_vectors(tmp_path):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((50, 8)).astype(np.float32)
+    generation = publish_generation(ArrayFlatIndex(vectors), [f"p{i}" for i in range(50)], store_dir=str(tmp_path))
+    snapshot = open_generation(generation, str(tmp_path))
+    assert isinstance(snapshot.index, MappedFlatIndex)
+    assert isinstance(snapshot.index.vectors.matrix(), np.memmap)
+    distances, ids = snapshot.index.search(vectors[[3, 7]] + 0.01, 3)
+    exact = ((vectors[None, :, :] - (vectors[[3, 7]] + 0.01)[:, None, :]) ** 2).sum(-1)
+    assert ids.tolist() == np.argsort(exact, axis=1)[:, :3].tolist()
+    assert distances == pytest.approx(np.sort(exact, axis=1)[:, :3], abs=1e-4)
+
+def test_real_faiss_flat_index_round_trip(tmp_path):
+    faiss = pytest.importorskip("faiss")
+    rng = np.random.default_rng(2)
+    vectors = rng.standard_normal((100, 16)).astype(np.float32)
+    flat = faiss.IndexFlatL2(16)
+    flat.add(vectors)
+    generation = publish_generation(flat, [str(i) for i in range(100)], store_dir=str(tmp_path))
+    snapshot = open_generation(generation, str(tmp_path))
+    expected_d, expected_i = flat.search(vectors[:5], 4)
+    distances, ids = snapshot.index.search(vectors[:5], 4)
+    assert ids.tolist() == expected_i.tolist()
+    assert distances == pytest.approx(expected_d, abs=1e-3)
+
+def test_reader_retries_when_a_generation_is_pruned_while_opening(tmp_path, monkeypatch):
+    store_dir = str(tmp_path)
+    publish_generation(None, ["first"], store_dir=store_dir)
+    reader = SharedIndexReader(store_dir, refresh_seconds=0)
+    assert reader.current().generation == 1
+    publish_generation(None, ["second"], store_dir=store_dir)
+
+    real_open = index_store.open_generation
+    def racing_open(generation, directory):
+        if generation == 2:
+            # The writer published and pruned again between CURRENT and the open.
+            publish_generation(None, ["third"], store_dir=store_dir)
+            raise FileNotFoundError(generation)
+        return real_open(generation, directory)
+    monkeypatch.setattr(index_store, "open_generation", racing_open)
+    assert list(reader.current().passages) == ["third"]
+
+def test_failed_queued_ingest_is_retried_then_dead_lettered(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "writer.db"))
+    monkeypatch.setattr(file_utils, "INGEST_MAX_ATTEMPTS", 2)
+    init_db()
+    database.enqueue_ingest("Estate tax is 6% of the net estate.", "estate.txt", "upload")
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("model not loaded")
+    monkeypatch.setattr(file_utils, "ingest_document", broken)
+    assert file_utils.drain_ingest_queue() == 0
+    assert len(pending_ingests()) == 1
+    assert file_utils.drain_ingest_queue() == 0
+    assert pending_ingests() == []
+    assert [(row[1], row[3], row[4]) for row in failed_ingests()] == [("estate.txt", 2, "model not loaded")]
+
+def test_reader_upload_digest_is_recorded_only_after_the_writer_indexes_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "reader.db"))
+    monkeypatch.setattr(file_utils, "SERVING_MODE", "reader")
+    init_db()
+    upload = tmp_path / "rmc.txt"
+    upload.write_text("RMC 5-2024 clarifies the VAT on digital services.")
+    path, digest, _ = file_utils.save_file(str(upload))
+
+    assert file_utils.ingest_upload(path, digest, "rmc.txt")[1]
+    assert not database.has_upload(digest)
+    assert pending_ingests()[0][-1] == digest
+
+    monkeypatch.setattr(file_utils, "SERVING_MODE", "writer")
+    def broken(*args, **kwargs):
+        raise RuntimeError("model not loaded")
+    monkeypatch.setattr(file_utils, "ingest_document", broken)
+    file_utils.drain_ingest_queue()
+    assert not database.has_upload(digest)
+
+    monkeypatch.setattr(file_utils, "ingest_document", lambda text, **kwargs: ("", True))
+    assert file_utils.drain_ingest_queue() == 1
+    assert database.has_upload(digest)
+    assert database.view_summaries() == []
@@ -0,0 +1,90 @@
+# test_ingest.py
+import os
+import numpy as np
+import pytest
+import database
+import file_utils
+from database import has_upload, init_db, view_summaries
+from file_utils import ingest_document, ingest_upload, learn_from_text, save_file
+
+class FakeEncoder:
+    def encode(self, texts, convert_to_tensor=False):
+        return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in texts], dtype=np.float32)
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "ingest.db"))
+    monkeypatch.setattr(file_utils, "model", FakeEncoder())
+    monkeypatch.setattr(file_utils, "index", None)
+    monkeypatch.setattr(file_utils, "knowledge_texts", [])
+    init_db()
+    return tmp_path
+
+def dynamic_files():
+    return [name for name in os.listdir(file_utils.DYNAMIC_DIR) if not name.startswith(".")]
+
+def test_upload_is_embedded_indexed_and_written_once(monkeypatch):
+    writes = []
+    original = file_utils.persist_faiss_index
+    monkeypatch.setattr(file_utils, "persist_faiss_index", lambda: (writes.append(1), original()))
+
+    text = "Percentage tax of 3% applies to non-VAT registered persons."
+    doc_hash, is_new = ingest_document(text, source="pt.txt", label="upload")
+    assert is_new
+    assert file_utils.index.ntotal == 1
+    assert dynamic_files() == [f"upload_{doc_hash}.txt"]
+    assert len(writes) == 1
+    assert any(row == (doc_hash, "pt.txt") for row in view_summaries())
+
+def test_repeat_ingest_is_a_no_op():
+    text = "Donor's tax is 6% of total gifts in excess of P250,000."
+    first_hash, first_new = ingest_document(text)
+    second_hash, second_new = ingest_document("  " + text + "\n")
+    learn_from_text(text)
+    assert first_new and not second_new
+    assert first_hash == second_hash
+    assert file_utils.index.ntotal == 1
+    assert len(dynamic_files()) == 1
+
+def test_empty_text_is_ignored():
+    assert ingest_document("   ") == ("", False)
+    assert file_utils.index is None
+
+def test_upload_is_stored_once_and_reupload_adds_nothing(tmp_path):
+    upload = tmp_path / "rr.txt"
+    upload.write_text("Revenue Regulations 2-98 list the creditable withholding tax rates.")
+
+    path, digest, err = save_file(str(upload))
+    assert not err
+    _, is_new = ingest_upload(path, digest, "rr.txt")
+    assert is_new
+    assert dynamic_files() == [os.path.basename(path)]
+
+    path, digest, _ = save_file(str(upload))
+    assert ingest_upload(path, digest, "rr.txt") == (digest, False)
+    assert dynamic_files() == [os.path.basename(path)]
+    assert file_utils.index.ntotal == 1
+    assert len(view_summaries()) == 1
+
+def test_upload_without_text_is_not_reported_as_known(tmp_path):
+    upload = tmp_path / "blank.txt"
+    upload.write_text("   \n")
+    path, digest, _ = save_file(str(upload))
+    assert ingest_upload(path, digest, "blank.txt") == ("", False)
+    assert not has_upload(digest)
+    assert view_summaries() == []
+
+def test_blank_upload_is_reported_as_unreadable(tmp_path, monkeypatch):
+    app = pytest.importorskip("app")
+    monkeypatch.setattr(app, "wait_until_ready", lambda *args: True)
+    upload = tmp_path / "blank.txt"
+    upload.write_text("")
+    path, digest, _ = save_file(str(upload))
+    assert app.index_saved_upload(path, digest, "blank.txt", "admin@example.com").startswith("❌ Could not extract text")
+
+def test_index_load_holds_the_ingest_lock(monkeypatch):
+    held = []
+    monkeypatch.setattr(file_utils, "_load_or_create_faiss_index", lambda skip: held.append(file_utils._ingest_lock.locked()))
+    file_utils.load_or_create_faiss_index()
+    assert held == [True]
@@ -0,0 +1,52 @@
+# test_lora_backend.py
+import threading
+import pytest
+import lora_backend
+from lora_backend import DynamicBatcher
+
+def test_concurrent_questions_share_a_batch():
+    batches = []
+    release = threading.Event()
+
+    def run_batch(items):
+        release.wait(1)
+        batches.append(list(items))
+        return [item.upper() for item in items]
+
+    batcher = DynamicBatcher(run_batch, max_batch=4, max_wait_ms=200)
+    results = {}
+    threads = [threading.Thread(target=lambda q=q: results.__setitem__(q, batcher.submit(q))) for q in "abcde"]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == {q: q.upper() for q in "abcde"}
+    assert sorted(len(b) for b in batches) == [1, 4]
+
+def test_batch_failure_reaches_every_caller():
+    def run_batch(items):
+        raise RuntimeError("out of memory")
+
+    batcher = DynamicBatcher(run_batch, max_batch=2, max_wait_ms=1)
+    with pytest.raises(RuntimeError, match="out of memory"):
+        batcher.submit("What is VAT?", timeout=5)
+
+def test_failed_model_load_is_not_retried(monkeypatch):
+    monkeypatch.setattr(lora_backend, "_batcher", None)
+    monkeypatch.setattr(lora_backend, "_load_failed", False)
+    monkeypatch.setattr(lora_backend, "latest_adapter", lambda: "tina-lora/run-1")
+    loads = []
+
+    def broken_generator():
+        loads.append(1)
+        raise OSError("base model not downloaded")
+    monkeypatch.setattr(lora_backend, "LoraGenerator", broken_generator)
+
+    assert lora_backend.is_available()
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match="could not be loaded"):
+            lora_backend.generate("What is the VAT rate?")
+    assert loads == [1]
+    assert not lora_backend.is_available()
@@ -0,0 +1,70 @@
+# test_metrics.py
+import threading
+import urllib.request
+import contextvars
+from metrics import Counter, Histogram, stage, track_request, render, start_metrics_server, STAGE_SECONDS
+
+def test_stage_records_request_timings_and_histogram():
+    before = STAGE_SECONDS.count("unit_test_stage")
+    with track_request() as timings:
+        with stage("unit_test_stage"):
+            pass
+        with stage("unit_test_stage"):
+            pass
+    assert set(timings) == {"unit_test_stage"}
+    assert STAGE_SECONDS.count("unit_test_stage") == before + 2
+
+def test_stage_outside_request_only_feeds_histogram():
+    with stage("unit_test_orphan"):
+        pass
+    assert STAGE_SECONDS.count("unit_test_orphan") >= 1
+
+def test_timings_follow_copied_context_into_threads():
+    with track_request() as timings:
+        def work():
+            with stage("unit_test_thread"):
+                pass
+        ctx = contextvars.copy_context()
+        t = threading.Thread(target=ctx.run, args=(work,))
+        t.start()
+        t.join()
+    assert "unit_test_thread" in timings
+
+def test_render_prometheus_text():
+    counter = Counter("unit_test_answers_total", "Test counter.", labels=("source",))
+    counter.inc("faiss")
+    counter.inc("faiss")
+    hist = Histogram("unit_test_seconds", "Test histogram.", buckets=(0.1, 1.0))
+    hist.observe(0.5)
+    text = render()
+    assert 'unit_test_answers_total{source="faiss"} 2' in text
+    assert 'unit_test_seconds_bucket{le="0.1"} 0' in text
+    assert 'unit_test_seconds_bucket{le="1"} 1' in text
+    assert 'unit_test_seconds_bucket{le="+Inf"} 1' in text
+    assert "unit_test_seconds_count 1" in text
+
+def test_metrics_endpoint():
+    server = start_metrics_server(0, host="127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics") as resp:
+            assert resp.status == 200
+            assert "tina_stage_seconds" in resp.read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+def test_render_while_new_series_appear():
+    histogram = Histogram("test_concurrent_render_seconds", "Render during observe.", labels=("stage",))
+    counter = Counter("test_concurrent_render_total", "Render during inc.", labels=("stage",))
+
+    def observe():
+        for i in range(2000):
+            histogram.observe(0.01, f"s{i}")
+            counter.inc(f"s{i}")
+
+    thread = threading.Thread(target=observe)
+    thread.start()
+    while thread.is_alive():
+        histogram.render()
+        counter.render()
+    thread.join()
+    assert len(counter.render()) == 2 + 2000
@@ -0,0 +1,46 @@
+# test_pipeline.py
+import pytest
+import faq
+import pipeline
+from pipeline import answer_question
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(faq, "lookup", lambda q: None)
+    monkeypatch.setattr(pipeline, "retrieve", lambda q, top_k: (["VAT is 12%."], True))
+    monkeypatch.setattr(pipeline, "generate_answer", lambda q: (calls.append("generate"), ("Generated.", "chatgpt"))[1])
+    monkeypatch.setattr(pipeline, "learn_from_text", lambda text: calls.append("learn"))
+    monkeypatch.setattr(pipeline, "log_query", lambda user, q, source, answer, timings=None: calls.append(("log", source)))
+    return calls
+
+def test_confident_retrieval_is_answered_from_the_knowledge_base(calls):
+    assert answer_question("What is the VAT rate?", "user@example.com") == ("VAT is 12%.", "faiss")
+    assert calls == [("log", "faiss")]
+
+def test_retrieval_miss_is_generated_learned_and_logged(calls, monkeypatch):
+    monkeypatch.setattr(pipeline, "retrieve", lambda q, top_k: ([], False))
+    assert answer_question("What is the tax on crypto?", "user@example.com") == ("Generated.", "chatgpt")
+    assert calls == ["generate", "learn", ("log", "chatgpt")]
+
+def test_refused_question_does_no_work(calls):
+    assert answer_question("What is the VAT rate?", "guest", admit=lambda: False) == (None, None)
+    assert calls == []
+
+def test_faq_answer_carries_its_citations(calls, monkeypatch):
+    entry = {"answer": "VAT is 12% under Sec. 106(A).", "citations": ["Sec. 106(A)"]}
+    monkeypatch.setattr(faq, "lookup", lambda q: entry)
+    answer, source = answer_question("What is the VAT rate?", "user@example.com")
+    assert source == "faq" and answer.endswith("📚 Sources: Sec. 106(A)")
+
+def test_failed_answer_refunds_the_admitted_slot(calls, monkeypatch):
+    def broken(question):
+        raise TimeoutError("OpenAI timed out")
+    monkeypatch.setattr(pipeline, "retrieve", lambda q, top_k: ([], False))
+    monkeypatch.setattr(pipeline, "generate_answer", broken)
+    with pytest.raises(TimeoutError):
+        answer_question("What is the tax on crypto?", "guest", admit=lambda: True, refund=lambda: calls.append("refund"))
+    assert calls == ["refund"]
+    monkeypatch.setattr(pipeline, "retrieve", lambda q, top_k: (["VAT is 12%."], True))
+    answer_question("What is the VAT rate?", "guest", admit=lambda: True, refund=lambda: calls.append("refund"))
+    assert calls == ["refund", ("log", "faiss")]
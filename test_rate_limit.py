@@ -0,0 +1,80 @@
+# test_rate_limit.py
+import multiprocessing
+import pytest
+from rate_limit import RateLimiter, MemoryBackend, SQLiteBackend, client_ip
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / "limits.db"))
+
+def test_limit_within_window(backend):
+    limiter = RateLimiter("reset", 3, 60, backend=backend)
+    assert [limiter.hit("a@example.com") for _ in range(4)] == [(True, 2), (True, 1), (True, 0), (False, 0)]
+    assert limiter.hit("b@example.com") == (True, 2)
+    assert limiter.remaining("a@example.com") == 0
+    limiter.reset("a@example.com")
+    assert limiter.remaining("a@example.com") == 3
+
+def test_refund_gives_back_the_last_hit(backend):
+    limiter = RateLimiter("guest", 2, 60, backend=backend)
+    limiter.hit("ip")
+    limiter.hit("ip")
+    limiter.refund("ip")
+    assert limiter.remaining("ip") == 1
+    assert limiter.hit("ip") == (True, 0)
+    limiter.refund("other")
+    assert limiter.remaining("other") == 2
+
+def test_sliding_window_expires(backend, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("rate_limit.time.time", lambda: now[0])
+    limiter = RateLimiter("guest", 2, 10, backend=backend)
+    limiter.hit("ip")
+    now[0] += 6
+    limiter.hit("ip")
+    assert limiter.hit("ip") == (False, 0)
+    now[0] += 5
+    assert limiter.hit("ip") == (True, 0)
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_keys=2)
+    limiter = RateLimiter("guest", 1, 60, backend=backend)
+    limiter.hit("a")
+    limiter.hit("b")
+    limiter.hit("c")
+    assert limiter.remaining("a") == 1
+    assert limiter.remaining("c") == 0
+
+def _worker(db_path, results):
+    limiter = RateLimiter("guest", 5, 60, backend=SQLiteBackend(db_path))
+    results.put(sum(limiter.hit("shared")[0] for _ in range(5)))
+
+def test_sqlite_backend_is_shared_across_processes(tmp_path):
+    db_path = str(tmp_path / "limits.db")
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker, args=(db_path, results)) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    assert sum(results.get() for _ in workers) == 5
+
+def test_client_ip_trusts_forwarded_for_only_from_proxies():
+    assert client_ip("10.0.0.2", "203.0.113.7, 10.0.0.2", trusted={"10.0.0.2"}) == "203.0.113.7"
+    assert client_ip("10.0.0.2", "203.0.113.7", trusted={"*"}) == "203.0.113.7"
+    assert client_ip("198.51.100.9", "203.0.113.7", trusted={"10.0.0.2"}) == "198.51.100.9"
+    assert client_ip("10.0.0.2", None, trusted={"*"}) == "10.0.0.2"
+    assert client_ip(None, None) == "anonymous"
+
+def test_failed_begin_surfaces_the_real_error(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "limits.db"))
+    backend._conn()
+    blocker = SQLiteBackend(str(tmp_path / "limits.db"))._conn()
+    blocker.execute("BEGIN IMMEDIATE")
+    backend._conn().execute("PRAGMA busy_timeout = 0")
+    with pytest.raises(Exception, match="locked"):
+        backend.hit("ip", 1, 60, 0.0)
+    blocker.execute("ROLLBACK")
+    assert backend.hit("ip", 1, 60, 0.0) == (True, 0)
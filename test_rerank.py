@@ -0,0 +1,31 @@
+# test_rerank.py
+import time
+import rerank
+
+class FakeCrossEncoder:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def predict(self, pairs, batch_size=16):
+        self.calls += 1
+        time.sleep(self.delay)
+        return [len(text) for _, text in pairs]
+
+def test_rerank_orders_by_cross_encoder_score(monkeypatch):
+    monkeypatch.setattr(rerank, "_cross_encoder", FakeCrossEncoder())
+    candidates = ["a", "ccc", "bb"]
+    assert rerank.rerank("q", candidates, top_k=3) == [1, 2, 0]
+
+def test_rerank_budget_keeps_dense_order_for_unscored(monkeypatch):
+    encoder = FakeCrossEncoder(delay=0.05)
+    monkeypatch.setattr(rerank, "_cross_encoder", encoder)
+    candidates = ["a", "bb", "c", "dddd"]
+    order = rerank.rerank("q", candidates, top_k=4, budget_ms=10, batch_size=2)
+    assert encoder.calls == 1
+    assert order == [1, 0, 2, 3]
+
+def test_rerank_without_model_falls_back(monkeypatch):
+    monkeypatch.setattr(rerank, "_cross_encoder", None)
+    monkeypatch.setattr(rerank, "_load_failed", True)
+    assert rerank.rerank("q", ["x", "y", "z"], top_k=2) == [0, 1]
@@ -0,0 +1,28 @@
+# test_retrieval.py
+import retrieval
+from retrieval import extract_citations, reciprocal_rank_fusion, hybrid_search
+
+def test_extract_citations():
+    q = "Does Sec. 34(L) apply under RR 8-2018 when filing BIR Form 1701Q?"
+    assert extract_citations(q) == ["Sec. 34(L)", "RR 8-2018", "BIR Form 1701Q"]
+    assert extract_citations("What is VAT?") == []
+
+def test_reciprocal_rank_fusion_weights():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], [1.0, 1.0], k=60)
+    assert [pid for pid, _ in fused] == [1, 3, 2]
+    lexical_only = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], [0.0, 1.0], k=60)
+    assert [pid for pid, _ in lexical_only] == [3, 1]
+
+def test_hybrid_search_citation_makes_retrieval_confident(monkeypatch):
+    monkeypatch.setattr(retrieval, "dense_search", lambda q, d: [(0, 0.9), (1, 1.0)])
+    monkeypatch.setattr(retrieval, "lexical_search", lambda q, d: ([(1, 7.5)], True))
+    ids, confident = hybrid_search("What is Sec. 34(L)?", top_k=2)
+    assert ids == [1, 0]
+    assert confident
+
+def test_hybrid_search_far_dense_hit_is_not_confident(monkeypatch):
+    monkeypatch.setattr(retrieval, "dense_search", lambda q, d: [(0, 0.9)])
+    monkeypatch.setattr(retrieval, "lexical_search", lambda q, d: ([(0, 1.2)], False))
+    ids, confident = hybrid_search("What is VAT?", top_k=3)
+    assert ids == [0]
+    assert not confident
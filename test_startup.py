@@ -0,0 +1,34 @@
+# test_startup.py
+import os
+import re
+import subprocess
+import sys
+
+HEAVY_MODULES = ["fitz", "pdfplumber", "pytesseract", "PIL", "docx", "faiss", "sentence_transformers", "torch", "openai"]
+# Cumulative import time budget for the retrieval stack, in microseconds.
+IMPORT_BUDGET_US = 1_500_000
+
+def run_python(code):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+
+def cumulative_us(stderr, module):
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)$", line)
+        if match and match.group(2) == module:
+            return int(match.group(1))
+    return 0
+
+def test_import_does_not_load_heavy_dependencies():
+    result = run_python(
+        "import sys, file_utils, retrieval, ask_tina\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert result.stdout.strip() == ""
+
+def test_import_time_within_budget():
+    result = run_python("import file_utils, retrieval")
+    total = cumulative_us(result.stderr, "file_utils") + cumulative_us(result.stderr, "retrieval")
+    assert 0 < total < IMPORT_BUDGET_US
@@ -0,0 +1,62 @@
+# test_training_data.py
+import os
+import numpy as np
+import pytest
+import database
+from database import init_db, log_query
+from dedup import NUM_PERM
+from training_data import commit_increment, data_dir, dedup_pairs, load_state, prepare_increment, read_shard, write_shard
+
+def fake_tokenize(texts):
+    return [[len(word) for word in text.split()] for text in texts]
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "train.db"))
+    init_db()
+    return data_dir("tiiuae/falcon-rw-1b", 256, root=str(tmp_path / "data"))
+
+def test_shard_round_trip(tmp_path):
+    path = str(tmp_path / "shard.npz")
+    write_shard(path, [[1, 2, 3], [], [7]])
+    assert read_shard(path) == [[1, 2, 3], [], [7]]
+
+def test_near_identical_pairs_are_dropped():
+    pairs = [
+        "Q: When is the deadline for BIR Form 1701 annual income tax return?\nA: It is due on or before April 15 of each year.",
+        "Q: When is the deadline for BIR Form 1701 annual income tax return??\nA: It is due on or before April 15 of each year.",
+        "Q: What is the VAT rate?\nA: Value-added tax is 12% of gross selling price.",
+    ]
+    kept, signatures = dedup_pairs(pairs, np.zeros((0, NUM_PERM), dtype=np.uint64))
+    assert kept == [pairs[0], pairs[2]]
+    again, _ = dedup_pairs([pairs[1]], signatures)
+    assert again == []
+
+def test_runs_only_read_new_rows(folder):
+    log_query("a@x.com", "What is the VAT rate today?", "chatgpt", "Value-added tax is 12% of gross selling price.")
+    log_query("b@x.com", "hi", "chatgpt", "Too short to train on.")
+    log_query("c@x.com", "What is documentary stamp tax?", "faiss", "A retrieved passage, not a generated answer.")
+
+    first = prepare_increment(fake_tokenize, folder)
+    assert first["new"] == 1 and first["last_log_id"] == 2
+    assert os.path.exists(os.path.join(folder, first["shard"]))
+    commit_increment(folder, first)
+    assert load_state(folder) == {"last_log_id": 2, "shards": [first["shard"]]}
+    assert prepare_increment(fake_tokenize, folder) is None
+
+    log_query("d@x.com", "What is the VAT rate today?", "chatgpt", "Value-added tax is 12% of gross selling price.")
+    log_query("e@x.com", "Who files BIR Form 2550Q?", "chatgpt", "VAT-registered persons file it quarterly.")
+    second = prepare_increment(fake_tokenize, folder, replay_fraction=1.0)
+    assert second["new"] == 1
+    # The new pair plus one replayed from the first shard.
+    assert len(second["sequences"]) == 2
+
+def test_failed_run_reuses_cached_shard(folder):
+    log_query("a@x.com", "What is the percentage tax rate?", "chatgpt", "Percentage tax is 3% of gross quarterly sales.")
+    calls = []
+    tokenize = lambda texts: calls.append(texts) or fake_tokenize(texts)
+    prepare_increment(tokenize, folder)
+    # Training crashed before commit_increment; the next run skips tokenization.
+    retry = prepare_increment(tokenize, folder)
+    assert retry["new"] == 1
+    assert len(calls) == 1
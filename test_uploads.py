@@ -0,0 +1,81 @@
+# test_uploads.py
+import time
+import hashlib
+import multiprocessing
+import pytest
+import uploads
+from uploads import append_chunk, finish_upload, purge_stale_uploads, start_upload, upload_status
+
+@pytest.fixture(autouse=True)
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(uploads, "_hashers", {})
+
+def test_chunked_upload_is_hashed_and_content_addressed():
+    data = b"BIR Ruling No. 123-2024 " * 1000
+    upload_id = start_upload("ruling.pdf", size=len(data))
+    for offset in range(0, len(data), 4096):
+        append_chunk(upload_id, offset, data[offset:offset + 4096])
+    path, digest, filename = finish_upload(upload_id)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert path.endswith(f"{digest}.pdf") and filename == "ruling.pdf"
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+def test_resume_after_restart_keeps_the_hash_right():
+    data = b"0123456789" * 50
+    upload_id = start_upload("scan.png", size=len(data))
+    append_chunk(upload_id, 0, data[:200])
+    uploads._hashers.clear()  # process restarted: only the partial file survives
+    offset = upload_status(upload_id)
+    assert offset == 200
+    append_chunk(upload_id, offset, data[offset:])
+    assert finish_upload(upload_id)[1] == hashlib.sha256(data).hexdigest()
+
+def test_out_of_order_and_oversized_chunks_are_rejected():
+    upload_id = start_upload("scan.png", size=10)
+    append_chunk(upload_id, 0, b"12345")
+    with pytest.raises(ValueError, match="Expected offset 5"):
+        append_chunk(upload_id, 0, b"12345")
+    with pytest.raises(ValueError, match="past the end"):
+        append_chunk(upload_id, 5, b"123456")
+    with pytest.raises(ValueError, match="incomplete"):
+        finish_upload(upload_id)
+
+def test_unknown_or_malformed_ids_are_rejected():
+    with pytest.raises(ValueError):
+        upload_status("../../etc/passwd")
+    with pytest.raises(ValueError):
+        append_chunk("0" * 32, 0, b"x")
+
+def test_stale_partials_are_purged():
+    upload_id = start_upload("scan.png")
+    append_chunk(upload_id, 0, b"partial")
+    assert purge_stale_uploads(max_age=-1) == 1
+    with pytest.raises(ValueError):
+        upload_status(upload_id)
+
+def _append_after(barrier, results, upload_id, data):
+    barrier.wait()
+    try:
+        results.put(append_chunk(upload_id, 0, data))
+    except ValueError:
+        results.put(None)
+
+def test_concurrent_processes_cannot_append_at_the_same_offset(monkeypatch):
+    data = b"x" * 1_000_000
+    upload_id = start_upload("scan.pdf", size=len(data))
+    read_meta = uploads._read_meta
+    # Widen the window between the offset check and the write.
+    monkeypatch.setattr(uploads, "_read_meta", lambda path: (time.sleep(0.2), read_meta(path))[1])
+    ctx = multiprocessing.get_context("fork")
+    barrier, results = ctx.Barrier(4), ctx.Queue()
+    workers = [ctx.Process(target=_append_after, args=(barrier, results, upload_id, data)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+    assert sorted(outcomes, key=str) == [len(data), None, None, None]
+    assert upload_status(upload_id) == len(data)
+    assert finish_upload(upload_id)[1] == hashlib.sha256(data).hexdigest()
@@ -0,0 +1,65 @@
+# test_username_index.py
+from username_index import UsernameIndex
+
+PROFILES = [
+    {"username": "juandelacruz", "email": "juan@example.com", "created_at": "2025-01-01T00:00:00"},
+    {"username": "JuanaReyes", "email": "juana@example.com", "created_at": "2025-01-02T00:00:00"},
+    {"username": "pedro_juan", "email": "pedro@example.com", "created_at": "2025-01-03T00:00:00"},
+    {"username": "maria", "email": "maria@example.com", "created_at": "2025-01-04T00:00:00"},
+]
+
+def paged(rows):
+    calls = []
+    def fetch(start, end, since=None):
+        calls.append((start, end) if since is None else (start, end, since))
+        matching = [r for r in rows if since is None or r["created_at"] >= since]
+        return matching[start:end + 1]
+    return fetch, calls
+
+def test_search_substring_prefix_first_and_limited():
+    fetch, _ = paged(PROFILES)
+    index = UsernameIndex(fetch)
+    assert [u for u, _ in index.search("juan")] == ["JuanaReyes", "juandelacruz", "pedro_juan"]
+    assert [u for u, _ in index.search("JUAN", limit=1)] == ["JuanaReyes"]
+    assert index.search("ju") == []
+    assert index.search("xyz") == []
+
+def test_loads_once_and_pages(monkeypatch):
+    monkeypatch.setattr("username_index.PAGE_SIZE", 3)
+    fetch, calls = paged(PROFILES)
+    index = UsernameIndex(fetch)
+    index.search("maria")
+    index.search("pedro")
+    assert calls == [(0, 2), (3, 5)]
+    assert len(index) == 4
+
+def test_add_is_visible_without_refresh():
+    fetch, calls = paged(PROFILES)
+    index = UsernameIndex(fetch)
+    index.search("maria")
+    index.add("newjuan", "new@example.com")
+    assert ("newjuan", "new@example.com") in index.search("juan")
+    assert len(calls) == 1
+
+def test_refresh_fetches_only_new_profiles():
+    rows = list(PROFILES)
+    fetch, calls = paged(rows)
+    index = UsernameIndex(fetch, ttl=0)
+    index.refresh()
+    rows.append({"username": "juanito", "email": "juanito@example.com", "created_at": "2025-02-01T00:00:00"})
+    index.refresh()
+    assert calls[-1] == (0, 999, "2025-01-04T00:00:00")
+    assert [u for u, _ in index.search("juan")] == ["JuanaReyes", "juandelacruz", "juanito", "pedro_juan"]
+    assert len(index) == 5
+    index.refresh()
+    assert calls[-1] == (0, 999, "2025-02-01T00:00:00")
+    assert len(index) == 5
+
+def test_full_reload_drops_deleted_profiles():
+    rows = list(PROFILES)
+    fetch, _ = paged(rows)
+    index = UsernameIndex(fetch)
+    index.refresh()
+    rows.remove(PROFILES[-1])
+    index.refresh(full=True)
+    assert index.search("maria") == []
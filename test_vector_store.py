@@ -0,0 +1,71 @@
+# test_vector_store.py
+import numpy as np
+import pytest
+from vector_store import RescoringIndex, VectorFile, needs_retrain
+
+class CoarseIndex:
+    """Stands in for a quantized index: right candidates, wrong order and distances."""
+
+    def __init__(self, dim):
+        self.d, self.ntotal = dim, 0
+
+    def add(self, vectors):
+        self.ntotal += len(vectors)
+
+    def search(self, queries, k):
+        ids = np.arange(self.ntotal)[::-1][:k]
+        return np.zeros((len(queries), len(ids)), np.float32), np.tile(ids, (len(queries), 1))
+
+def test_vector_file_appends_and_reads_rows(tmp_path):
+    vectors = VectorFile(str(tmp_path / "v.f32"), 3)
+    vectors.write(np.eye(3, dtype=np.float32))
+    vectors.append(np.full((1, 3), 2.0, np.float32))
+    assert len(vectors) == 4
+    assert vectors.rows([3, 0]).tolist() == [[2.0, 2.0, 2.0], [1.0, 0.0, 0.0]]
+
+def test_rescoring_orders_by_exact_distance(tmp_path):
+    base = np.array([[0, 0], [1, 0], [5, 5], [0.9, 0.1]], dtype=np.float32)
+    index = RescoringIndex(CoarseIndex(2), VectorFile(str(tmp_path / "v.f32"), 2), "sq8", rescore_factor=2)
+    index.add(base)
+    distances, ids = index.search(np.array([[1.0, 0.0]], np.float32), 2)
+    assert ids[0].tolist() == [1, 3]
+    assert distances[0].tolist() == pytest.approx([0.0, 0.02])
+    assert index.reconstruct(2).tolist() == [5.0, 5.0]
+    assert index.ntotal == 4
+
+@pytest.mark.parametrize("index_type", ["fp16", "sq8", "pq"])
+def test_compressed_index_matches_flat_top_hit(tmp_path, monkeypatch, index_type):
+    pytest.importorskip("faiss")
+    import vector_store
+    monkeypatch.setattr(vector_store, "PQ_M", 4)
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal((300, 16)).astype(np.float32)
+    base /= np.linalg.norm(base, axis=1, keepdims=True)
+    index = vector_store.build_index(base, str(tmp_path / "v.f32"), index_type)
+    distances, ids = index.search(base[:20], 1)
+    assert ids[:, 0].tolist() == list(range(20))
+    assert distances[:, 0] == pytest.approx(0.0, abs=1e-5)
+
+def test_rewrite_leaves_existing_maps_intact(tmp_path):
+    vectors = VectorFile(str(tmp_path / "v.f32"), 2)
+    vectors.write(np.ones((3, 2), np.float32))
+    old = vectors.matrix()
+    vectors.write(np.zeros((1, 2), np.float32))
+    assert old.tolist() == [[1.0, 1.0]] * 3
+    assert vectors.matrix().tolist() == [[0.0, 0.0]]
+
+def test_pq_stand_in_is_retrained_once_large_enough(tmp_path, monkeypatch):
+    index = RescoringIndex(CoarseIndex(2), VectorFile(str(tmp_path / "v.f32"), 2), "sq8")
+    index.add(np.zeros((10, 2), np.float32))
+    assert not needs_retrain(index, "pq")
+    assert not needs_retrain(index, "sq8")
+    index.add(np.zeros((300, 2), np.float32))
+    assert needs_retrain(index, "pq")
+
+    pytest.importorskip("faiss")
+    import vector_store
+    monkeypatch.setattr(vector_store, "PQ_M", 2)
+    small = vector_store.build_index(np.random.default_rng(0).standard_normal((10, 8)).astype(np.float32), str(tmp_path / "pq.f32"), "pq")
+    assert small.index_type == "sq8"
+    small.add(np.random.default_rng(1).standard_normal((300, 8)).astype(np.float32))
+    assert vector_store.retrain(small, str(tmp_path / "pq.f32"), "pq").index_type == "pq"
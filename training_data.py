@@ -0,0 +1,150 @@
+# training_data.py
+"""Incremental training data for fine_tune_model.py.
+
+Each run only reads ``logs`` rows past the high-water mark of the last
+successful run. It drops pairs that are near-identical to each other or to
+anything already trained on, and tokenizes the survivors once into a shard
+under TRAINING_DATA_DIR. The run then trains on the new shard plus a small
+replay sample of earlier shards. Shards and state live in a folder per
+tokenizer and max_length, so changing either starts over cleanly.
+"""
+import os
+import re
+import glob
+import json
+import random
+import logging
+import numpy as np
+from database import get_conn
+from dedup import MemoryLSH, minhash, NUM_PERM
+
+logger = logging.getLogger(__name__)
+
+BASE_MODEL = os.getenv("FINE_TUNE_BASE_MODEL", "tiiuae/falcon-rw-1b")
+LORA_DIR = "tina-lora"
+TRAINING_DATA_DIR = os.getenv("TRAINING_DATA_DIR", os.path.join(LORA_DIR, "data"))
+TRAIN_CONTEXTS = ("semantic", "lora", "chatgpt")
+REPLAY_FRACTION = float(os.getenv("TRAIN_REPLAY_FRACTION", "0.2"))
+PAIR_DUP_THRESHOLD = float(os.getenv("PAIR_DUP_THRESHOLD", "0.9"))
+MIN_QUESTION_CHARS = 8
+MIN_ANSWER_CHARS = 10
+
+def format_prompt(question: str) -> str:
+    """Prompt in the layout the adapter was trained on; the answer follows."""
+    return f"Q: {question}\nA:"
+
+def latest_adapter(root: str = LORA_DIR) -> str | None:
+    """Most recent tina-lora/run-* folder holding a saved adapter."""
+    runs = sorted(glob.glob(os.path.join(root, "run-*", "adapter_config.json")))
+    return os.path.dirname(runs[-1]) if runs else None
+
+def data_dir(model_name: str, max_length: int, root: str = TRAINING_DATA_DIR) -> str:
+    folder = os.path.join(root, f"{re.sub(r'[^a-zA-Z0-9_.-]', '_', model_name)}-{max_length}")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def load_state(folder: str) -> dict:
+    try:
+        with open(os.path.join(folder, "state.json"), "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {"last_log_id": 0, "shards": []}
+    if "last_rowid" in state:
+        # Written before logs had an id column; the migration kept each rowid as its id.
+        state["last_log_id"] = state.pop("last_rowid")
+    return state
+
+def load_signatures(folder: str) -> np.ndarray:
+    path = os.path.join(folder, "signatures.npy")
+    return np.load(path) if os.path.exists(path) else np.zeros((0, NUM_PERM), dtype=np.uint64)
+
+def fetch_pairs(since_id: int) -> tuple[list[str], int]:
+    """Formatted Q&A pairs logged after log id ``since_id``, and the highest id read."""
+    placeholders = ",".join("?" * len(TRAIN_CONTEXTS))
+    with get_conn() as conn:
+        c = conn.cursor()
+        c.execute(
+            f"SELECT id, query, response FROM logs WHERE id > ? AND context IN ({placeholders}) ORDER BY id",
+            (since_id, *TRAIN_CONTEXTS)
+        )
+        rows = c.fetchall()
+    last_id = rows[-1][0] if rows else since_id
+    pairs = [
+        f"{format_prompt(q)} {a}" for _, q, a in rows
+        if q and a and len(q) > MIN_QUESTION_CHARS and len(a) > MIN_ANSWER_CHARS
+    ]
+    return pairs, last_id
+
+def dedup_pairs(pairs: list[str], known: np.ndarray, threshold: float = PAIR_DUP_THRESHOLD) -> tuple[list[str], np.ndarray]:
+    """Drop pairs near-identical to an earlier pair or to one in ``known``; returns survivors and their signatures."""
+    lsh = MemoryLSH(threshold)
+    for signature in known:
+        lsh.add(signature)
+    kept, signatures = [], []
+    for pair in pairs:
+        signature = minhash(pair)
+        if lsh.find(signature) is not None:
+            continue
+        lsh.add(signature)
+        kept.append(pair)
+        signatures.append(signature)
+    return kept, np.array(signatures, dtype=np.uint64).reshape(-1, NUM_PERM)
+
+def write_shard(path: str, sequences: list[list[int]]):
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in sequences])
+    ids = np.concatenate([np.asarray(s, dtype=np.int32) for s in sequences]) if sequences else np.zeros(0, np.int32)
+    np.savez(path, ids=ids, offsets=offsets)
+
+def read_shard(path: str) -> list[list[int]]:
+    with np.load(path) as shard:
+        ids, offsets = shard["ids"], shard["offsets"]
+    return [ids[offsets[i]:offsets[i + 1]].tolist() for i in range(len(offsets) - 1)]
+
+def prepare_increment(tokenize, folder: str, replay_fraction: float = REPLAY_FRACTION, seed: int = 42) -> dict | None:
+    """Build the next training increment, or None when nothing new was logged.
+
+    ``tokenize`` maps a list of texts to a list of token id lists. Returns a
+    dict with ``sequences`` (new plus replayed), ``new`` (count of new ones)
+    and the bookkeeping ``commit_increment`` needs once training succeeds.
+    """
+    state = load_state(folder)
+    pairs, last_id = fetch_pairs(state["last_log_id"])
+    if last_id == state["last_log_id"]:
+        return None
+    known = load_signatures(folder)
+    pairs, signatures = dedup_pairs(pairs, known)
+    increment = {"last_log_id": last_id, "signatures": np.vstack([known, signatures]), "shard": None, "sequences": [], "new": 0}
+    if not pairs:
+        return increment
+
+    shard = f"shard-{state['last_log_id'] + 1:09d}-{last_id:09d}.npz"
+    path = os.path.join(folder, shard)
+    if os.path.exists(path):
+        sequences = read_shard(path)
+    else:
+        sequences = tokenize(pairs)
+        write_shard(path, sequences)
+
+    replay = []
+    rng = random.Random(seed)
+    for old in state["shards"]:
+        old_path = os.path.join(folder, old)
+        if os.path.exists(old_path):
+            replay.extend(read_shard(old_path))
+    replay = rng.sample(replay, min(len(replay), int(len(sequences) * replay_fraction)))
+    logger.info(f"Training increment: {len(sequences)} new pairs, {len(replay)} replayed")
+    increment.update(shard=shard, sequences=sequences + replay, new=len(sequences))
+    return increment
+
+def commit_increment(folder: str, increment: dict):
+    """Advance the high-water mark; call only after the increment trained successfully."""
+    state = load_state(folder)
+    if increment["shard"] and increment["shard"] not in state["shards"]:
+        state["shards"].append(increment["shard"])
+    state["last_log_id"] = increment["last_log_id"]
+    np.save(os.path.join(folder, "signatures.npy"), increment["signatures"])
+    tmp = os.path.join(folder, "state.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, os.path.join(folder, "state.json"))
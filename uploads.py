@@ -0,0 +1,151 @@
+# uploads.py
+"""Resumable chunked uploads for large scans.
+
+    upload_id = start_upload("bir-ruling.pdf", size=52_428_800)
+    append_chunk(upload_id, 0, first_chunk)          # returns bytes received
+    upload_status(upload_id)                         # after a dropped connection: resume here
+    path, digest, filename = finish_upload(upload_id)
+
+Chunks must arrive in order: ``offset`` has to equal the bytes already received,
+so a retried chunk is rejected instead of being written twice. The offset check
+and the write run under an exclusive ``flock`` on the partial file, so workers
+in different processes cannot both append at the same offset. The SHA-256 is
+updated as chunks land; after a restart it is rebuilt from the partial file.
+Finished files go into the same content-addressed store as ``save_file``.
+"""
+import os
+import re
+import json
+import fcntl
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from file_utils import PARTIAL_DIR, UPLOAD_CHUNK_SIZE, sanitize_filename, store_content_addressed
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_PARTIAL_TTL = float(os.getenv("UPLOAD_PARTIAL_TTL", "86400"))
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+_hashers = {}  # upload_id -> (sha256 so far, bytes hashed)
+_lock = threading.Lock()
+
+def _paths(upload_id: str) -> tuple[str, str]:
+    if not _UPLOAD_ID.match(upload_id or ""):
+        raise ValueError("Unknown upload.")
+    data = os.path.join(PARTIAL_DIR, f"{upload_id}.part")
+    meta = os.path.join(PARTIAL_DIR, f"{upload_id}.json")
+    if not os.path.exists(meta):
+        raise ValueError("Unknown upload.")
+    return data, meta
+
+def _read_meta(meta_path: str) -> dict:
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+@contextmanager
+def _locked(upload_id: str):
+    """Hold the upload's flock (other processes) and ``_lock`` (other threads); yields its paths."""
+    data_path, _ = _paths(upload_id)
+    try:
+        fd = os.open(data_path, os.O_RDONLY)
+    except FileNotFoundError:
+        raise ValueError("Unknown upload.")
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with _lock:
+            # Check again: another process may have finished or purged it while we waited.
+            yield _paths(upload_id)
+    finally:
+        os.close(fd)
+
+def _hasher(upload_id: str, data_path: str):
+    received = os.path.getsize(data_path)
+    digest, hashed = _hashers.get(upload_id, (None, -1))
+    if hashed != received:
+        # First chunk after a restart (or a crash mid-write): rehash what is on disk.
+        digest = hashlib.sha256()
+        with open(data_path, "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest
+
+def start_upload(filename: str, size: int | None = None) -> str:
+    if size is not None and size > MAX_UPLOAD_BYTES:
+        raise ValueError(f"File too large (limit {MAX_UPLOAD_BYTES // (1024 * 1024)} MB).")
+    os.makedirs(PARTIAL_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    open(os.path.join(PARTIAL_DIR, f"{upload_id}.part"), "wb").close()
+    with open(os.path.join(PARTIAL_DIR, f"{upload_id}.json"), "w", encoding="utf-8") as f:
+        json.dump({"filename": sanitize_filename(os.path.basename(filename)), "size": size, "started": time.time()}, f)
+    return upload_id
+
+def upload_status(upload_id: str) -> int:
+    """Bytes received so far, i.e. the offset of the next chunk."""
+    data_path, _ = _paths(upload_id)
+    return os.path.getsize(data_path)
+
+def append_chunk(upload_id: str, offset: int, data: bytes) -> int:
+    with _locked(upload_id) as (data_path, meta_path):
+        received = os.path.getsize(data_path)
+        if offset != received:
+            raise ValueError(f"Expected offset {received}, got {offset}.")
+        size = _read_meta(meta_path).get("size")
+        if received + len(data) > (size if size is not None else MAX_UPLOAD_BYTES):
+            raise ValueError("Chunk runs past the end of the file.")
+        digest = _hasher(upload_id, data_path)
+        with open(data_path, "ab") as f:
+            f.write(data)
+        digest.update(data)
+        _hashers[upload_id] = (digest, received + len(data))
+        return received + len(data)
+
+def finish_upload(upload_id: str) -> tuple[str, str, str]:
+    """Move a complete upload into storage; returns (path, sha256, original filename)."""
+    with _locked(upload_id) as (data_path, meta_path):
+        meta = _read_meta(meta_path)
+        received = os.path.getsize(data_path)
+        if meta.get("size") is not None and received != meta["size"]:
+            raise ValueError(f"Upload incomplete: {received} of {meta['size']} bytes received.")
+        digest = _hasher(upload_id, data_path).hexdigest()
+        _hashers.pop(upload_id, None)
+        path = store_content_addressed(data_path, digest, os.path.splitext(meta["filename"])[1])
+        os.remove(meta_path)
+    logger.info(f"Finished chunked upload {upload_id}: {path} ({received} bytes)")
+    return path, digest, meta["filename"]
+
+def purge_stale_uploads(max_age: float = UPLOAD_PARTIAL_TTL) -> int:
+    """Delete partial uploads that received nothing for ``max_age`` seconds; returns how many."""
+    if not os.path.isdir(PARTIAL_DIR):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    with _lock:
+        for name in os.listdir(PARTIAL_DIR):
+            path = os.path.join(PARTIAL_DIR, name)
+            stem, ext = os.path.splitext(name)
+            if ext != ".part":
+                continue
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # finished by another process meanwhile
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(path)
+                meta_path = os.path.join(PARTIAL_DIR, f"{stem}.json")
+                if os.path.exists(meta_path):
+                    os.remove(meta_path)
+                _hashers.pop(stem, None)
+                removed += 1
+            except (BlockingIOError, FileNotFoundError):
+                pass  # another process is writing to or finishing it
+            finally:
+                os.close(fd)
+    return removed
@@ -0,0 +1,138 @@
+# username_index.py
+"""In-memory trigram index over profile usernames.
+
+``recover_user_email`` used to send a leading-wildcard ILIKE to Supabase on
+every lookup. This index loads (username, email) pairs in pages once, answers
+substring queries by intersecting trigram posting lists, and every
+USERNAME_INDEX_TTL fetches only the profiles created since its watermark and
+merges them in. A full reload runs every USERNAME_INDEX_FULL_TTL to drop
+deleted profiles. New signups are added immediately via ``add``.
+"""
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+USERNAME_INDEX_TTL = float(os.getenv("USERNAME_INDEX_TTL", "600"))
+USERNAME_INDEX_FULL_TTL = float(os.getenv("USERNAME_INDEX_FULL_TTL", "86400"))
+MIN_KEYWORD_LENGTH = 3
+PAGE_SIZE = 1000
+# Profiles are only ever inserted (register_user), so creation time is the change time.
+CHANGED_COLUMN = "created_at"
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class UsernameIndex:
+    def __init__(self, fetch_page, ttl: float = USERNAME_INDEX_TTL, full_ttl: float = USERNAME_INDEX_FULL_TTL):
+        """``fetch_page(start, end, since)`` returns up to ``end - start + 1`` dicts with username,
+        email and CHANGED_COLUMN, oldest first; with ``since`` only rows changed at or after it."""
+        self.fetch_page = fetch_page
+        self.ttl = ttl
+        self.full_ttl = full_ttl
+        self._entries = {}
+        self._postings = {}
+        self._watermark = None
+        self._loaded_at = None
+        self._full_loaded_at = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, entries: dict, postings: dict, username: str, email: str):
+        key = username.lower()
+        entries.setdefault(key, set()).add((username, email))
+        for gram in trigrams(key):
+            postings.setdefault(gram, set()).add(key)
+
+    def add(self, username: str, email: str):
+        if not username:
+            return
+        with self._lock:
+            self._insert(self._entries, self._postings, username, email)
+
+    def _fetch(self, since) -> list[dict]:
+        rows, start = [], 0
+        while True:
+            page = self.fetch_page(start, start + PAGE_SIZE - 1, since) or []
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    def refresh(self, full: bool = False):
+        """Merge in profiles changed since the last refresh, or reload all of them when ``full``."""
+        full = full or self._watermark is None
+        rows = self._fetch(None if full else self._watermark)
+        changed = [row[CHANGED_COLUMN] for row in rows if row.get(CHANGED_COLUMN)]
+        if full:
+            entries, postings = {}, {}
+        else:
+            entries, postings = self._entries, self._postings
+        with self._lock:
+            # ``since`` is inclusive, so boundary rows come back again; inserting is idempotent.
+            for row in rows:
+                if row.get("username"):
+                    self._insert(entries, postings, row["username"], row.get("email", ""))
+            self._entries, self._postings = entries, postings
+            if changed:
+                self._watermark = max(changed)
+            self._loaded_at = time.monotonic()
+            if full:
+                self._full_loaded_at = self._loaded_at
+
+    def _refresh_in_background(self, full: bool = False):
+        try:
+            with self._load_lock:
+                self.refresh(full=full)
+        except Exception as e:
+            logger.warning(f"Username index refresh failed: {e}")
+        finally:
+            self._refreshing = False
+
+    def start_loading(self) -> threading.Thread:
+        """Load the index in the background so the first search does not pay for it."""
+        self._refreshing = True
+        thread = threading.Thread(target=self._refresh_in_background, name="tina-username-index", daemon=True)
+        thread.start()
+        return thread
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None:
+            with self._load_lock:
+                if self._loaded_at is None:
+                    self.refresh(full=True)
+        elif time.monotonic() - self._loaded_at > self.ttl and not self._refreshing:
+            # Serve the current index while the changes load.
+            self._refreshing = True
+            full = time.monotonic() - self._full_loaded_at > self.full_ttl
+            threading.Thread(target=self._refresh_in_background, args=(full,), daemon=True).start()
+
+    def search(self, keyword: str, limit: int = 10) -> list[tuple[str, str]]:
+        """Usernames containing ``keyword`` (case-insensitive), prefix matches first."""
+        keyword = keyword.strip().lower()
+        if len(keyword) < MIN_KEYWORD_LENGTH:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            grams = sorted(trigrams(keyword), key=lambda g: len(self._postings.get(g, ())))
+            candidates = set(self._postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= self._postings.get(gram, set())
+            matches = sorted(
+                (key for key in candidates if keyword in key),
+                key=lambda key: (not key.startswith(keyword), key)
+            )
+            results = []
+            for key in matches:
+                results.extend(sorted(self._entries[key]))
+                if len(results) >= limit:
+                    break
+        return results[:limit]
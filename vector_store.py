@@ -0,0 +1,227 @@
+# vector_store.py
+"""Optional compressed FAISS storage with exact re-scoring.
+
+INDEX_TYPE selects how vectors are held in RAM:
+
+    flat   float32 IndexFlatL2, 1536 B per 384-dim passage (default)
+    fp16   scalar quantizer, half precision, 768 B
+    sq8    scalar quantizer, 8 bits per dimension, 384 B
+    pq     product quantizer, PQ_M bytes (48 by default)
+
+For every type but flat the full-precision vectors are appended to a raw
+float32 file that is memory-mapped, not loaded. A search pulls
+RESCORE_FACTOR x k candidates from the compressed index and re-ranks them by
+exact L2 distance read from that file. Distances therefore keep the meaning
+FAISS_THRESHOLD expects. Only the candidate rows are paged in.
+"""
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").lower()
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+PQ_M = int(os.getenv("PQ_M", "48"))
+PQ_MIN_TRAIN = 256
+# Below this many training vectors sq8 also covers [-1, 1], the range of a
+# normalized embedding, so later uploads are not clipped.
+SQ_MIN_TRAIN = 1000
+
+class VectorFile:
+    """Append-only float32 matrix on disk, read through a memory map."""
+
+    def __init__(self, path: str, dim: int):
+        self.path, self.dim = path, dim
+        self._map = None
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.path) // (4 * self.dim)
+        except OSError:
+            return 0
+
+    def write(self, vectors: np.ndarray):
+        # Replace rather than truncate: an index being searched keeps mapping the old file.
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        os.replace(tmp, self.path)
+        self._map = None
+
+    def append(self, vectors: np.ndarray):
+        with open(self.path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._map = None
+
+    def matrix(self) -> np.ndarray:
+        """The whole file as a read-only (n, dim) memory map."""
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.float32, mode="r").reshape(-1, self.dim)
+        return self._map
+
+    def rows(self, ids) -> np.ndarray:
+        return np.asarray(self.matrix()[np.asarray(ids, dtype=np.int64)])
+
+class RescoringIndex:
+    """A compressed FAISS index whose candidates are re-ranked with exact float32 distances.
+
+    Exposes the subset of the FAISS index API the app uses: ``ntotal``, ``d``,
+    ``add``, ``search`` and ``reconstruct``.
+    """
+
+    def __init__(self, index, vectors: VectorFile, index_type: str, rescore_factor: int = RESCORE_FACTOR):
+        self.index = index
+        self.vectors = vectors
+        self.index_type = index_type  # what was built, which may differ from INDEX_TYPE
+        self.rescore_factor = max(1, rescore_factor)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.index.d
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.vectors.append(vectors)
+        self.index.add(vectors)
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return self.vectors.rows([i])[0]
+
+    def search(self, queries: np.ndarray, k: int):
+        _, candidates = self.index.search(queries, min(k * self.rescore_factor, max(self.ntotal, 1)))
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(queries, candidates)):
+            ids = ids[ids >= 0]
+            if not len(ids):
+                continue
+            exact = np.sum((self.vectors.rows(ids) - query) ** 2, axis=1)
+            order = np.argsort(exact)[:k]
+            distances[row, :len(order)] = exact[order]
+            indices[row, :len(order)] = ids[order]
+        return distances, indices
+
+class MappedFlatIndex:
+    """Read-only exact L2 search straight over a memory-mapped VectorFile.
+
+    Shared index readers use this instead of a FAISS IndexFlat, whose vectors
+    faiss would copy into every process's heap. Only the squared norms (4 bytes
+    per passage) live in process memory.
+    """
+
+    BLOCK = 65536
+
+    def __init__(self, vectors: VectorFile):
+        self.vectors = vectors
+        self.d = vectors.dim
+        self.ntotal = len(vectors)
+        matrix = vectors.matrix() if self.ntotal else np.zeros((0, self.d), np.float32)
+        self._norms = np.concatenate(
+            [np.einsum("ij,ij->i", matrix[i:i + self.BLOCK], matrix[i:i + self.BLOCK]) for i in range(0, self.ntotal, self.BLOCK)]
+        ) if self.ntotal else np.zeros(0, np.float32)
+
+    def add(self, vectors: np.ndarray):
+        raise RuntimeError("Shared index generations are read-only.")
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return self.vectors.rows([i])[0]
+
+    def search(self, queries: np.ndarray, k: int):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        if not self.ntotal:
+            return np.full((len(queries), k), np.inf, np.float32), np.full((len(queries), k), -1, np.int64)
+        matrix = self.vectors.matrix()
+        distances = np.empty((len(queries), self.ntotal), dtype=np.float32)
+        for i in range(0, self.ntotal, self.BLOCK):
+            block = matrix[i:i + self.BLOCK]
+            distances[:, i:i + len(block)] = self._norms[i:i + len(block)] - 2.0 * (queries @ block.T)
+        distances += np.sum(queries ** 2, axis=1, keepdims=True)
+        top = min(k, self.ntotal)
+        ids = np.argpartition(distances, top - 1, axis=1)[:, :top]
+        out_d = np.full((len(queries), k), np.inf, dtype=np.float32)
+        out_i = np.full((len(queries), k), -1, dtype=np.int64)
+        for row in range(len(queries)):
+            order = ids[row][np.argsort(distances[row, ids[row]])]
+            out_d[row, :top] = np.maximum(distances[row, order], 0.0)
+            out_i[row, :top] = order
+        return out_d, out_i
+
+def built_type(index_type: str, count: int) -> str:
+    """The type ``build_index`` produces for ``count`` vectors: PQ needs PQ_MIN_TRAIN to train."""
+    return "sq8" if index_type == "pq" and count < PQ_MIN_TRAIN else index_type
+
+def index_type_of(index) -> str | None:
+    if index is None:
+        return None
+    return index.index_type if isinstance(index, RescoringIndex) else "flat"
+
+def needs_retrain(index, index_type: str = INDEX_TYPE) -> bool:
+    """True once a stand-in index (sq8 for pq) has grown enough to build the configured type."""
+    return isinstance(index, RescoringIndex) and index.index_type != built_type(index_type, index.ntotal)
+
+def retrain(index, vectors_path: str, index_type: str = INDEX_TYPE):
+    """Rebuild a compressed index from its own float32 vectors; nothing is re-embedded."""
+    return build_index(np.array(index.vectors.matrix()), vectors_path, index_type)
+
+def _new_faiss_index(embeddings: np.ndarray, index_type: str):
+    import faiss
+    dim = embeddings.shape[1]
+    if index_type == "pq":
+        index = faiss.IndexPQ(dim, PQ_M, 8)
+        index.train(embeddings)
+    elif index_type == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        sample = embeddings
+        if len(embeddings) < SQ_MIN_TRAIN:
+            sample = np.vstack([embeddings, -np.ones((1, dim), np.float32), np.ones((1, dim), np.float32)])
+        index.train(sample)
+    else:
+        raise ValueError(f"Unknown INDEX_TYPE: {index_type}")
+    return index
+
+def build_index(embeddings: np.ndarray, vectors_path: str, index_type: str = INDEX_TYPE):
+    """Index ``embeddings`` (n, dim); compressed types also write them to ``vectors_path``."""
+    import faiss
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+        index.add(embeddings)
+        return index
+    built = built_type(index_type, len(embeddings))
+    if built != index_type:
+        logger.info(f"{len(embeddings)} vectors are too few to train {index_type}; using {built} until there are {PQ_MIN_TRAIN}.")
+    vectors = VectorFile(vectors_path, embeddings.shape[1])
+    vectors.write(embeddings)
+    index = _new_faiss_index(embeddings, built)
+    index.add(embeddings)
+    return RescoringIndex(index, vectors, built)
+
+def write_index(index, path: str):
+    import faiss
+    faiss.write_index(index.index if isinstance(index, RescoringIndex) else index, path)
+
+def wrap_loaded(index, vectors_path: str):
+    """Attach the on-disk float32 vectors to a loaded compressed index; None if they are missing or stale."""
+    import faiss
+    if isinstance(index, faiss.IndexFlat):
+        return index
+    vectors = VectorFile(vectors_path, index.d)
+    if len(vectors) != index.ntotal:
+        return None
+    if isinstance(index, faiss.IndexPQ):
+        index_type = "pq"
+    else:
+        index_type = "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return RescoringIndex(index, vectors, index_type)
+
+def index_bytes(index) -> int:
+    """In-memory size of the vectors held by ``index`` (excluding the on-disk re-scoring file)."""
+    import faiss
+    return int(faiss.serialize_index(index.index if isinstance(index, RescoringIndex) else index).nbytes)